@@ -0,0 +1,184 @@
+"""
+analytics.py — Model accuracy from user feedback.
+
+Each feedback row says whether the scan's prediction was right and, if
+not, what the pest actually was. Those (predicted, actual) pairs are
+counted in the confusion_matrix table, per user. The count is updated
+by an ORM hook in the same transaction that inserts (or deletes) the
+feedback, so reports only read the small matrix table and never scan
+`feedbacks`. Precision and recall per class, and overall accuracy, are
+derived from the matrix on request.
+
+Feedback on archived scans (retention.py) stays counted, because
+archiving removes rows without going through the ORM delete hook.
+"""
+
+import json
+import os
+from collections import Counter
+
+from sqlalchemy import case, delete, event, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from cache import TTLCache
+from models import db, Scan, Feedback, ArchivedScan, ConfusionCell
+
+# Test-set accuracy of the fine-tuned EfficientNetB0 (88.3%), shown until there is enough feedback
+MODEL_ACCURACY = 88
+ACCURACY_MIN_FEEDBACK = int(os.environ.get('AGBOT_ACCURACY_MIN_FEEDBACK', 5))
+ANALYTICS_CACHE_TTL = int(os.environ.get('AGBOT_ANALYTICS_CACHE_TTL', 60))
+
+_global_totals = TTLCache(maxsize=1, ttl=ANALYTICS_CACHE_TTL)
+_cells = ConfusionCell.__table__
+
+
+def _labels(predicted, is_correct, actual_name):
+    predicted = (predicted or 'None').strip()
+    if is_correct:
+        return predicted, predicted
+    actual = (actual_name or '').strip()
+    if actual.lower() == predicted.lower():
+        actual = predicted
+    return predicted, actual
+
+
+# ─── Incremental maintenance ───────────────────────────────────────────────────
+
+def _bump(connection, user_id, predicted, actual, delta):
+    where = (_cells.c.user_id == user_id) & (_cells.c.predicted == predicted) & (_cells.c.actual == actual)
+    if delta < 0:
+        connection.execute(_cells.update().where(where).values(count=_cells.c.count + delta))
+        return
+
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if dialect == 'sqlite' else pg_insert)(_cells).values(
+            user_id=user_id, predicted=predicted, actual=actual, count=delta)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'predicted', 'actual'],
+            set_={'count': _cells.c.count + delta}))
+        return
+
+    if connection.execute(_cells.update().where(where).values(count=_cells.c.count + delta)).rowcount == 0:
+        connection.execute(insert(_cells).values(user_id=user_id, predicted=predicted, actual=actual, count=delta))
+
+
+def _on_feedback(connection, target, delta):
+    row = connection.execute(select(Scan.pest_identified).where(Scan.id == target.scan_id)).first()
+    if row is None:
+        return
+    predicted, actual = _labels(row[0], target.is_correct, target.actual_pest_name)
+    _bump(connection, target.user_id, predicted, actual, delta)
+
+
+@event.listens_for(Feedback, 'after_insert')
+def _count_feedback(mapper, connection, target):
+    _on_feedback(connection, target, 1)
+
+
+@event.listens_for(Feedback, 'after_delete')
+def _uncount_feedback(mapper, connection, target):
+    _on_feedback(connection, target, -1)
+
+
+def rebuild(connection):
+    """Recompute the whole matrix from feedback (hot and archived). Returns the number of cells."""
+    counts = Counter()
+    rows = connection.execute(
+        select(Feedback.user_id, Scan.pest_identified, Feedback.is_correct, Feedback.actual_pest_name)
+        .join(Scan, Scan.id == Feedback.scan_id))
+    for user_id, predicted, is_correct, actual_name in rows:
+        counts[(user_id,) + _labels(predicted, is_correct, actual_name)] += 1
+
+    archived = connection.execute(
+        select(ArchivedScan.user_id, ArchivedScan.pest_identified, ArchivedScan.feedback_json)
+        .where(ArchivedScan.feedback_json.isnot(None)))
+    for user_id, predicted, feedback_json in archived:
+        for fb in json.loads(feedback_json):
+            counts[(user_id,) + _labels(predicted, fb.get('is_correct'), fb.get('actual_pest_name'))] += 1
+
+    connection.execute(delete(_cells))
+    if counts:
+        connection.execute(insert(_cells), [
+            {'user_id': u, 'predicted': p, 'actual': a, 'count': n} for (u, p, a), n in counts.items()])
+    _global_totals.clear()
+    return len(counts)
+
+
+# ─── Reports ────────────────────────────────────────────────────────────────────
+
+def _totals(user_id=None):
+    query = db.session.query(
+        func.coalesce(func.sum(ConfusionCell.count), 0),
+        func.coalesce(func.sum(case((ConfusionCell.predicted == ConfusionCell.actual, ConfusionCell.count),
+                                    else_=0)), 0))
+    if user_id is not None:
+        query = query.filter(ConfusionCell.user_id == user_id)
+    total, correct = query.one()
+    return int(total), int(correct)
+
+
+def global_totals():
+    totals = _global_totals.get('all')
+    if totals is None:
+        totals = _totals()
+        _global_totals.set('all', totals)
+    return totals
+
+
+def dashboard_accuracy(user_id, default):
+    """Feedback-based accuracy (whole percent) for the dashboard.
+
+    Uses the user's own feedback once there is enough of it, then everyone's,
+    and finally `default` (the model's benchmark accuracy).
+    """
+    for total, correct in (_totals(user_id), global_totals()):
+        if total >= ACCURACY_MIN_FEEDBACK:
+            return round(correct / total * 100)
+    return default
+
+
+def report(user_id=None):
+    """Confusion matrix with overall accuracy and per-class precision/recall.
+
+    user_id=None reports over all users.
+    """
+    query = db.session.query(ConfusionCell.predicted, ConfusionCell.actual, func.sum(ConfusionCell.count))
+    if user_id is not None:
+        query = query.filter(ConfusionCell.user_id == user_id)
+    cells = [(p, a, int(n)) for p, a, n in query.group_by(ConfusionCell.predicted, ConfusionCell.actual) if n]
+
+    total = sum(n for _, _, n in cells)
+    correct = sum(n for p, a, n in cells if p == a)
+    predicted_totals, actual_totals, true_pos = Counter(), Counter(), Counter()
+    for p, a, n in cells:
+        predicted_totals[p] += n
+        if a:
+            actual_totals[a] += n
+        if p == a:
+            true_pos[p] += n
+
+    per_class = []
+    for label in sorted(set(predicted_totals) | set(actual_totals)):
+        precision = true_pos[label] / predicted_totals[label] if predicted_totals[label] else None
+        recall = true_pos[label] / actual_totals[label] if actual_totals[label] else None
+        f1 = (2 * precision * recall / (precision + recall)
+              if precision is not None and recall is not None and precision + recall else None)
+        per_class.append({
+            'label': label,
+            'precision': round(precision, 4) if precision is not None else None,
+            'recall': round(recall, 4) if recall is not None else None,
+            'f1': round(f1, 4) if f1 is not None else None,
+            'predicted': predicted_totals[label],
+            'support': actual_totals[label],
+        })
+
+    return {
+        'total_feedback': total,
+        'correct': correct,
+        'accuracy': round(correct / total * 100, 1) if total else None,
+        'unlabeled_incorrect': sum(n for _, a, n in cells if not a),
+        'matrix': [{'predicted': p, 'actual': a or None, 'count': n} for p, a, n in cells],
+        'per_class': per_class,
+    }
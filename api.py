@@ -3,18 +3,20 @@ AGBOT Mobile API Blueprint
 JSON API for the React Native and iOS mobile apps.
 Registered on the main Flask app in app.py.
 """
-from flask import Blueprint, jsonify, request, send_from_directory
+from flask import Blueprint, Response, g, jsonify, request, send_from_directory, stream_with_context
 from datetime import datetime, timedelta
 import base64
 import io
 import json
+import logging
+import mimetypes
 import os
 import sys
 import jwt
-import urllib.request
 from functools import wraps
 from werkzeug.utils import secure_filename
-from models import db, User, Scan, Feedback, PestDatabase
+from models import db, User, Scan, Feedback, PestDatabase, Tombstone, SyncOperation
+from sqlalchemy import and_, func, or_
 from sqlalchemy.exc import IntegrityError
 
 # Add ml_model to path for imports
@@ -22,39 +24,46 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'ml_model'))
 from model import get_model
 from knowledge_base import get_pest_info, get_pest_info_by_name, get_all_pest_names, _load as _load_pest_data_raw
 from questionnaire import load_questionnaire, analyze_answers
+import i18n
+import auth_cache
+import passwords
+from weather import get_weather
+import storage
+import ingest
+import retention
+import analytics
+import metrics
+import export
+import health
+import rate_limit
 
 bp = Blueprint('mobile_api', __name__)
+log = logging.getLogger('agbot.api')
 
 JWT_SECRET = 'your-jwt-secret-key'
 
-# Load translations
-translations = {}
-for lang in ['en', 'es', 'hi', 'sw']:
-    try:
-        with open(f'translations/{lang}.json', 'r', encoding='utf-8') as f:
-            translations[lang] = json.load(f)
-    except FileNotFoundError:
-        translations[lang] = {}
-
 # Configuration
-UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'tiff'}
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def get_user_dashboard_data(user_id):
     """Build real dashboard data from the database."""
     from sqlalchemy import func, extract
 
-    total_scans = Scan.query.filter_by(user_id=user_id).count()
-    healthy_scans = Scan.query.filter_by(user_id=user_id, severity='Healthy').count()
-    pest_scans = Scan.query.filter_by(user_id=user_id).filter(Scan.severity != 'Healthy', Scan.severity.isnot(None)).count()
+    # Archived scans (retention.py) only survive as monthly aggregates here
+    archived = retention.archived_totals(user_id)
+    archived_months = retention.archived_monthly_counts(user_id)
+    archived_severity = archived['severity']
+
+    total_scans = Scan.query.filter_by(user_id=user_id).count() + archived['total']
+    healthy_scans = Scan.query.filter_by(user_id=user_id, severity='Healthy').count() + archived['healthy']
+    pest_scans = Scan.query.filter_by(user_id=user_id).filter(Scan.severity != 'Healthy', Scan.severity.isnot(None)).count() + archived['pests']
     healthy_pct = round((healthy_scans / total_scans * 100) if total_scans > 0 else 0)
 
     user_data = {
         'total_scans': total_scans,
         'healthy_percentage': healthy_pct,
         'pests_detected': pest_scans,
-        'ai_accuracy': 94,
+        'ai_accuracy': analytics.dashboard_accuracy(user_id, default=analytics.MODEL_ACCURACY),
     }
 
     # Recent detections from DB
@@ -84,7 +93,7 @@ def get_user_dashboard_data(user_id):
         count = Scan.query.filter_by(user_id=user_id).filter(
             extract('month', Scan.created_at) == m,
             extract('year', Scan.created_at) == y
-        ).count()
+        ).count() + archived_months.get(f'{y:04d}-{m:02d}', 0)
         months.append(month_name)
         values.append(count)
 
@@ -92,14 +101,16 @@ def get_user_dashboard_data(user_id):
 
     # Health distribution from real data
     if total_scans > 0:
-        mild = Scan.query.filter_by(user_id=user_id, severity='Mild').count()
-        moderate = Scan.query.filter_by(user_id=user_id, severity='Moderate').count()
-        high = Scan.query.filter_by(user_id=user_id).filter(Scan.severity.in_(['High', 'Severe'])).count()
+        mild = Scan.query.filter_by(user_id=user_id, severity='Mild').count() + archived_severity.get('Mild', 0)
+        moderate = Scan.query.filter_by(user_id=user_id, severity='Moderate').count() + archived_severity.get('Moderate', 0)
+        high = Scan.query.filter_by(user_id=user_id).filter(Scan.severity.in_(['High', 'Severe'])).count() \
+            + archived_severity.get('High', 0) + archived_severity.get('Severe', 0)
+        severe = Scan.query.filter_by(user_id=user_id, severity='Severe').count() + archived_severity.get('Severe', 0)
         health_distribution = {
             'healthy': round(healthy_scans / total_scans * 100) if total_scans else 0,
             'pest_damage': round((mild + moderate) / total_scans * 100) if total_scans else 0,
             'disease': round(high / total_scans * 100) if total_scans else 0,
-            'critical': round(Scan.query.filter_by(user_id=user_id, severity='Severe').count() / total_scans * 100) if total_scans else 0,
+            'critical': round(severe / total_scans * 100) if total_scans else 0,
         }
     else:
         health_distribution = {'healthy': 0, 'pest_damage': 0, 'disease': 0, 'critical': 0}
@@ -129,8 +140,8 @@ def token_required(f):
         if auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
             try:
-                data = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-                current_user = User.query.get(data['user_id'])
+                data = auth_cache.decode_token(token, JWT_SECRET)
+                current_user = auth_cache.get_user(data['user_id'])
             except jwt.ExpiredSignatureError:
                 return jsonify({'error': 'Token has expired'}), 401
             except jwt.InvalidTokenError:
@@ -148,10 +159,20 @@ def token_required(f):
         if current_user is None:
             return jsonify({'error': 'Authentication required'}), 401
 
+        if not current_user.is_active:
+            return jsonify({'error': 'Account is disabled'}), 401
+
+        g.api_user = current_user
         return f(current_user, *args, **kwargs)
     return decorated
 
 
+@bp.errorhandler(passwords.HashingBusy)
+def handle_hashing_busy(e):
+    return jsonify({'error': 'Server is busy, please try again shortly'}), 503, \
+        {'Retry-After': str(passwords.RETRY_AFTER)}
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -257,45 +278,19 @@ def api_dashboard(current_user):
 
 @bp.route('/api/analyze', methods=['POST'])
 @token_required
+@rate_limit.limit('analyze')
 def api_analyze(current_user):
     try:
-        image_bytes = None
-
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-                with open(filepath, 'rb') as f:
-                    image_bytes = f.read()
-            else:
-                return jsonify({'error': 'Invalid file format'}), 400
-        else:
-            data = request.get_json(silent=True)
-            if data and 'image_data' in data:
-                image_str = data['image_data']
-                if ',' in image_str:
-                    image_str = image_str.split(',')[1]
-                image_bytes = base64.b64decode(image_str)
-            else:
-                return jsonify({'error': 'No image provided'}), 400
+        image_bytes = ingest.read_image(request, allowed_file)
+    except ingest.IngestError as e:
+        return jsonify({'error': str(e)}), e.status
 
+    try:
         # Run real AI model inference
         result = run_pest_detection(image_bytes)
 
-        # Save image for history
-        saved_filename = None
-        if 'image' in request.files:
-            saved_filename = filename
-        else:
-            # Save base64 image to file
-            from PIL import Image as PILImage
-            img = PILImage.open(io.BytesIO(image_bytes)).convert('RGB')
-            saved_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_scan.jpg"
-            img.save(os.path.join(UPLOAD_FOLDER, saved_filename), 'JPEG', quality=85)
+        # Save image for history (content-addressed, deduplicated)
+        saved_filename = storage.save(image_bytes)
 
         # Save to DB
         scan = Scan(
@@ -309,18 +304,21 @@ def api_analyze(current_user):
             damage_pattern=result.get('damage_pattern', '')
         )
         db.session.add(scan)
-        db.session.commit()
+        with metrics.stage('db_commit'):
+            db.session.commit()
 
         result['scan_id'] = scan.id
         return jsonify(result)
+    except rate_limit.Overloaded:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception('Analyze failed')
         return jsonify({'error': str(e)}), 500
 
 
 @bp.route('/api/analyze_symptoms', methods=['POST'])
 @token_required
+@rate_limit.limit('symptoms')
 def api_analyze_symptoms(current_user):
     try:
         data = request.get_json()
@@ -340,7 +338,8 @@ def api_analyze_symptoms(current_user):
             status='Analyzed'
         )
         db.session.add(scan)
-        db.session.commit()
+        with metrics.stage('db_commit'):
+            db.session.commit()
 
         result['scan_id'] = scan.id
         return jsonify(result)
@@ -355,18 +354,264 @@ def api_analyze_symptoms(current_user):
 def api_history(current_user):
     db_scans = Scan.query.filter_by(user_id=current_user.id).order_by(Scan.created_at.desc()).all()
 
-    history = [scan.to_dict() for scan in db_scans]
+    counts = _feedback_counts(current_user.id)
+    history = [scan.to_dict(has_feedback=counts.get(scan.id, 0) > 0) for scan in db_scans]
 
-    total = len(history)
     pests = sum(1 for h in history if h.get('severity') not in ['Healthy', None])
+    archived = retention.archived_totals(current_user.id)
+    total = len(history) + archived['total']
+    pests += archived['pests']
     healthy = total - pests
 
+    # Scans past the retention window are only loaded when asked for
+    if request.args.get('include_archived', '').lower() in ('1', 'true', 'yes'):
+        history += [scan.to_dict() for scan in retention.archived_scans(current_user.id)]
+
     return jsonify({
         'history': history,
-        'stats': {'total_scans': total, 'pests_found': pests, 'healthy': healthy}
+        'stats': {'total_scans': total, 'pests_found': pests, 'healthy': healthy,
+                  'archived_scans': archived['total']}
     })
 
 
+# ─── Offline Sync ──────────────────────────────────────────────────────────────
+
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_OPS = 50
+# Watermarks are moved back by this much so rows committed by a concurrent
+# request just before "now" are not skipped. Clients upsert by id, so the
+# small overlap is harmless.
+SYNC_SKEW = timedelta(seconds=5)
+
+
+def _parse_watermark(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid watermark')
+
+
+def _parse_cursor(value):
+    """(updated_at, scan id) from a sync watermark; the id is None for a plain timestamp."""
+    if not value:
+        return None, None
+    ts, sep, scan_id = str(value).partition('|')
+    try:
+        return _parse_watermark(ts), int(scan_id) if sep else None
+    except (TypeError, ValueError):
+        raise ValueError('Invalid watermark')
+
+
+def _feedback_counts(user_id, scan_ids=None):
+    """{scan id: feedback rows} for a user's scans, in one grouped query."""
+    query = db.session.query(Feedback.scan_id, func.count(Feedback.id)).filter(Feedback.user_id == user_id)
+    if scan_ids is not None:
+        query = query.filter(Feedback.scan_id.in_(scan_ids))
+    return dict(query.group_by(Feedback.scan_id).all())
+
+
+def _pull_changes(user_id, since, since_id=None):
+    """Scans/feedback changed at or after `since` plus tombstones, and the next watermark.
+
+    A page that stops mid-way returns a '<updated_at>|<id>' watermark, so the
+    next page resumes after the last scan sent even when many scans share
+    one updated_at.
+    """
+    now = datetime.utcnow()
+
+    scans_q = Scan.query.filter_by(user_id=user_id)
+    if since_id is not None:
+        scans_q = scans_q.filter(or_(Scan.updated_at > since,
+                                     and_(Scan.updated_at == since, Scan.id > since_id)))
+    elif since is not None:
+        scans_q = scans_q.filter(Scan.updated_at >= since)
+    scans = scans_q.order_by(Scan.updated_at, Scan.id).limit(SYNC_PAGE_SIZE + 1).all()
+    has_more = len(scans) > SYNC_PAGE_SIZE
+    scans = scans[:SYNC_PAGE_SIZE]
+    upper = scans[-1].updated_at if has_more else None
+    counts = _feedback_counts(user_id, [scan.id for scan in scans]) if scans else {}
+
+    def window(query, column):
+        if since is not None:
+            query = query.filter(column >= since)
+        if upper is not None:
+            query = query.filter(column <= upper)
+        return query
+
+    feedback = window(Feedback.query.filter_by(user_id=user_id), Feedback.updated_at).all()
+    tombstones = window(Tombstone.query.filter_by(user_id=user_id), Tombstone.deleted_at).all() \
+        if since is not None else []
+
+    watermark = f'{upper.isoformat()}|{scans[-1].id}' if has_more else (now - SYNC_SKEW).isoformat()
+    return {
+        'watermark': watermark,
+        'has_more': has_more,
+        'full': since is None,
+        'scans': [scan.to_dict(has_feedback=counts.get(scan.id, 0) > 0) for scan in scans],
+        'feedback': [fb.to_dict() for fb in feedback],
+        'tombstones': [t.to_dict() for t in tombstones],
+    }
+
+
+def _build_scan(user_id, op):
+    """Validate, rate-limit and analyze a queued scan; returns an unsaved Scan."""
+    try:
+        captured_at = _parse_watermark(op.get('captured_at'))
+    except ValueError:
+        raise ingest.IngestError('Invalid captured_at')
+    if captured_at is not None and captured_at > datetime.utcnow():
+        captured_at = None
+
+    # Queued scans pay the same per-user limits as /api/analyze and /api/analyze_symptoms
+    if op.get('image_data'):
+        if rate_limit.ENABLED:
+            rate_limit.check('analyze', user_id)
+        image_bytes = ingest.decode_base64_image(op['image_data'])
+        result = run_pest_detection(image_bytes)
+        image_path = storage.save(image_bytes)
+        status = result.get('status')
+    elif op.get('symptoms', '').strip():
+        if rate_limit.ENABLED:
+            rate_limit.check('symptoms', user_id)
+        result = analyze_text_symptoms(op['symptoms'].strip(), op.get('plant_type', '').strip())
+        result = {'pest_identified': result['disease_name'], 'confidence': result['confidence'],
+                  'severity': result.get('severity', 'Unknown')}
+        image_path, status = None, 'Analyzed'
+    else:
+        raise ingest.IngestError('Scan needs image_data or symptoms')
+
+    scan = Scan(
+        user_id=user_id,
+        image_path=image_path,
+        pest_identified=result.get('pest_identified'),
+        pest_scientific=result.get('pest_scientific', ''),
+        confidence=result.get('confidence'),
+        status=status,
+        severity=result.get('severity', 'Unknown'),
+        damage_pattern=result.get('damage_pattern', ''),
+        crop_type=op.get('crop_type'),
+        field_name=op.get('field_name'),
+    )
+    if captured_at is not None:
+        scan.created_at = captured_at
+    return scan
+
+
+def _build_feedback(user_id, op, scan_ids_by_key):
+    """Validate a queued feedback op; returns an unsaved Feedback."""
+    scan_id = op.get('scan_id') or scan_ids_by_key.get(op.get('scan_key'))
+    if not scan_id or not Scan.query.filter_by(id=scan_id, user_id=user_id).first():
+        raise ingest.IngestError('Unknown scan', 404)
+    if op.get('is_correct') is None:
+        raise ingest.IngestError('is_correct is required')
+    return Feedback(
+        user_id=user_id,
+        scan_id=scan_id,
+        is_correct=bool(op['is_correct']),
+        actual_pest_name=op.get('actual_pest_name'),
+        notes=op.get('notes')
+    )
+
+
+def _apply_ops(user, ops):
+    """Apply queued offline operations; each is idempotent on its idempotency_key.
+
+    Inference and image writes run before anything is written to the
+    database, and each op then commits its row and SyncOperation in its own
+    short transaction, so the SQLite write lock is never held during a
+    model call. An image saved for an op whose commit fails is left for
+    storage.collect_garbage().
+    """
+    user_id = user.id
+    results = []
+    scan_ids_by_key = {}
+    for op in ops:
+        key = str(op.get('idempotency_key') or '')[:64]
+        kind = op.get('type')
+        if not key or kind not in ('scan', 'feedback'):
+            results.append({'idempotency_key': key, 'status': 'error',
+                            'error': 'idempotency_key and type (scan|feedback) are required'})
+            continue
+
+        done = SyncOperation.query.filter_by(user_id=user_id, idempotency_key=key).first()
+        if done is None:
+            try:
+                if kind == 'scan':
+                    record = _build_scan(user_id, op)
+                else:
+                    record = _build_feedback(user_id, op, scan_ids_by_key)
+                db.session.add(record)
+                db.session.flush()
+                result_id = record.id
+                db.session.add(SyncOperation(user_id=user_id, idempotency_key=key,
+                                             kind=kind, result_id=result_id))
+                db.session.commit()
+                status = 'applied'
+            except IntegrityError:
+                # Same key applied concurrently by another request
+                db.session.rollback()
+                done = SyncOperation.query.filter_by(user_id=user_id, idempotency_key=key).first()
+                if done is None:
+                    results.append({'idempotency_key': key, 'status': 'error', 'error': 'Conflict'})
+                    continue
+            except ingest.IngestError as e:
+                db.session.rollback()
+                results.append({'idempotency_key': key, 'status': 'error', 'error': str(e)})
+                continue
+            except (rate_limit.RateLimited, rate_limit.Overloaded) as e:
+                # Not applied; the client keeps the op queued and retries it later
+                db.session.rollback()
+                results.append({'idempotency_key': key, 'status': 'error', 'error': str(e),
+                                'retry_after': e.retry_after})
+                continue
+            except Exception as e:
+                db.session.rollback()
+                log.exception('Sync op failed', extra={'idempotency_key': key})
+                results.append({'idempotency_key': key, 'status': 'error', 'error': 'Could not apply operation'})
+                continue
+
+        if done is not None:
+            kind, result_id, status = done.kind, done.result_id, 'duplicate'
+        if kind == 'scan':
+            scan_ids_by_key[key] = result_id
+        results.append({'idempotency_key': key, 'status': status, 'type': kind, 'id': result_id})
+
+    return results
+
+
+@bp.route('/api/sync', methods=['GET', 'POST'])
+@token_required
+def api_sync(current_user):
+    """Delta sync for offline-first clients.
+
+    GET  /api/sync?since=<watermark>
+    POST /api/sync  {"since": <watermark>, "ops": [{"type": "scan"|"feedback", "idempotency_key": ..., ...}]}
+
+    Uploaded ops are applied first, then everything changed since the
+    watermark is returned with a new watermark for the next call.
+    """
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+    try:
+        since, since_id = _parse_cursor(data.get('since') or request.args.get('since'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    ops = data.get('ops') or []
+    if not isinstance(ops, list) or len(ops) > SYNC_MAX_OPS:
+        return jsonify({'error': f'ops must be a list of at most {SYNC_MAX_OPS} operations'}), 400
+
+    user_id = current_user.id
+    results = _apply_ops(current_user, ops) if ops else []
+    changes = _pull_changes(user_id, since, since_id)
+    changes['results'] = results
+    retry_after = max((r.get('retry_after', 0) for r in results), default=0)
+    if retry_after:
+        return jsonify(changes), 200, {'Retry-After': str(retry_after)}
+    return jsonify(changes)
+
+
 # ─── Profile / Settings ────────────────────────────────────────────────────────
 
 @bp.route('/api/profile', methods=['PUT'])
@@ -464,8 +709,34 @@ def api_pests():
 @bp.route('/api/export/scans', methods=['GET'])
 @token_required
 def api_export_scans(current_user):
-    scans = Scan.query.filter_by(user_id=current_user.id).order_by(Scan.created_at.desc()).all()
-    return jsonify([scan.to_dict() for scan in scans])
+    """Stream the user's scan history.
+
+    ?format=json (default) | ndjson | csv, optional ?from= / ?to= dates
+    (ISO; a bare date for `to` includes that day), ?include_archived=1 to
+    append scans moved to the archive, and ?gzip=1 to compress the stream
+    when the client accepts gzip.
+    """
+    fmt = request.args.get('format', 'json').lower()
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(export.FORMATS)}"}), 400
+    try:
+        start = export.parse_date(request.args.get('from'))
+        end = export.parse_date(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'error': 'Invalid date (use YYYY-MM-DD)'}), 400
+
+    compress = (request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+                and 'gzip' in request.accept_encodings)
+    include_archived = request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+    body = export.generate(current_user.id, fmt, start, end, compress, include_archived)
+    response = Response(stream_with_context(body), mimetype=export.FORMATS[fmt])
+    filename = f"agbot_scans_{datetime.utcnow():%Y%m%d}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 @bp.route('/api/export/profile', methods=['GET'])
@@ -473,11 +744,29 @@ def api_export_scans(current_user):
 def api_export_profile(current_user):
     return jsonify({
         'user': current_user.to_dict(),
-        'total_scans': Scan.query.filter_by(user_id=current_user.id).count(),
+        'total_scans': Scan.query.filter_by(user_id=current_user.id).count()
+                       + retention.archived_totals(current_user.id)['total'],
         'exported_at': datetime.utcnow().isoformat()
     })
 
 
+# ─── Analytics ──────────────────────────────────────────────────────────────────
+
+@bp.route('/api/analytics/accuracy', methods=['GET'])
+@token_required
+def api_analytics_accuracy(current_user):
+    """Confusion matrix and per-class precision/recall from feedback.
+
+    ?scope=me (default) covers the user's own feedback, ?scope=all everyone's.
+    """
+    scope = request.args.get('scope', 'me')
+    if scope not in ('me', 'all'):
+        return jsonify({'error': 'scope must be me or all'}), 400
+    result = analytics.report(current_user.id if scope == 'me' else None)
+    result['scope'] = scope
+    return jsonify(result)
+
+
 # ─── Stats ──────────────────────────────────────────────────────────────────────
 
 @bp.route('/api/stats', methods=['GET'])
@@ -498,9 +787,9 @@ def api_stats(current_user):
 
 @bp.route('/api/translations/<lang>', methods=['GET'])
 def api_translations(lang):
-    if lang not in translations:
+    if not i18n.is_supported(lang):
         lang = 'en'
-    return jsonify(translations[lang])
+    return jsonify(i18n.get_translations(lang))
 
 
 # ─── Real AI Analysis Helpers ──────────────────────────────────────────────────
@@ -508,7 +797,8 @@ def api_translations(lang):
 def run_pest_detection(image_bytes):
     """Run fine-tuned EfficientNetB0 model inference on image bytes."""
     model = get_model()
-    predictions = model.predict(image_bytes, top_k=5)
+    with rate_limit.inference_slot(), health.inference():
+        predictions = model.predict(image_bytes, top_k=5)
 
     top = predictions[0]
 
@@ -563,7 +853,8 @@ def run_pest_detection(image_bytes):
         }
 
     # Pest detected — get full info from knowledge base
-    pest_info = get_pest_info_by_name(top['class_name'])
+    with metrics.stage('kb_lookup'):
+        pest_info = get_pest_info_by_name(top['class_name'])
 
     severity = pest_info.get('severity_level', 'Unknown')
     severity_map = {'Low': 'Mild', 'Moderate': 'Moderate', 'High': 'High',
@@ -737,6 +1028,7 @@ def analyze_text_symptoms(symptoms, plant_type=''):
 
 @bp.route('/api/chat', methods=['POST'])
 @token_required
+@rate_limit.limit('chat')
 def api_chat(current_user):
     data = request.get_json()
     message = data.get('message', '').strip()
@@ -806,44 +1098,72 @@ def api_questionnaire_analyze(current_user):
     return jsonify({'success': False, 'error': 'Could not identify pest'}), 400
 
 
-# ─── Weather ───────────────────────────────────────────────────────────────────
-
-WEATHER_API_KEY = 'demo'  # Replace with your OpenWeatherMap API key (free at openweathermap.org)
-
-def get_weather(location=None):
-    """Fetch real weather data from OpenWeatherMap API."""
-    if WEATHER_API_KEY == 'demo' or not location:
-        return {'temperature': 24, 'condition': 'Sunny', 'humidity': 65, 'icon': 'sun.max.fill'}
+# ─── Image Serving ─────────────────────────────────────────────────────────────
 
-    try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={WEATHER_API_KEY}&units=metric"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            data = json.loads(resp.read().decode())
-            condition = data['weather'][0]['main']
-            icon_map = {'Clear': 'sun.max.fill', 'Clouds': 'cloud.fill', 'Rain': 'cloud.rain.fill',
-                        'Drizzle': 'cloud.drizzle.fill', 'Thunderstorm': 'cloud.bolt.fill',
-                        'Snow': 'cloud.snow.fill', 'Mist': 'cloud.fog.fill', 'Fog': 'cloud.fog.fill'}
-            return {
-                'temperature': round(data['main']['temp']),
-                'condition': condition,
-                'humidity': data['main']['humidity'],
-                'icon': icon_map.get(condition, 'cloud.fill'),
-                'wind': round(data['wind']['speed']),
-                'location': data['name'],
-            }
-    except Exception as e:
-        print(f"Weather API error: {e}")
-        return {'temperature': 24, 'condition': 'Sunny', 'humidity': 65, 'icon': 'sun.max.fill'}
+# How upload bytes leave the server:
+#   ''           Flask streams the file (conditional GET + Range via Werkzeug)
+#   'x-accel'    nginx: X-Accel-Redirect to an `internal` location aliased to static/uploads
+#   'x-sendfile' Apache mod_xsendfile / lighttpd: X-Sendfile with the absolute path
+UPLOAD_SENDFILE_MODE = os.environ.get('AGBOT_UPLOAD_SENDFILE', '')
+UPLOAD_ACCEL_PREFIX = os.environ.get('AGBOT_UPLOAD_ACCEL_PREFIX', '/_uploads/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+LEGACY_MAX_AGE = 3600
+
+
+def _upload_response(key):
+    """Response for a stored file, with immutable caching for content-named keys."""
+    if storage.digest_of(key) is None:
+        # Legacy flat names could in principle be overwritten, so keep caching short
+        return send_from_directory(storage.folder_for(key), key, max_age=LEGACY_MAX_AGE)
+
+    # The name is the content hash (plus rendition suffix), so it is a perfect strong ETag
+    etag = os.path.basename(key).split('.', 1)[0]
+
+    folder = storage.folder_for(key)
+    # Archived (cold) images are rare; the worker sends those itself
+    if UPLOAD_SENDFILE_MODE in ('x-accel', 'x-sendfile') and folder == storage.UPLOAD_FOLDER:
+        if not storage.is_safe_key(key) or not os.path.isfile(storage.path_for(key)):
+            return jsonify({'error': 'Not found'}), 404
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream')
+            if UPLOAD_SENDFILE_MODE == 'x-accel':
+                response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + key
+            else:
+                response.headers['X-Sendfile'] = storage.path_for(key)
+        response.set_etag(etag)
+    else:
+        response = send_from_directory(folder, key, etag=etag,
+                                       max_age=IMMUTABLE_MAX_AGE, conditional=True)
+        response.headers['Accept-Ranges'] = 'bytes'
 
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
 
-# ─── Image Serving ─────────────────────────────────────────────────────────────
 
-@bp.route('/api/uploads/<filename>', methods=['GET'])
+@bp.route('/api/uploads/<path:filename>', methods=['GET'])
 def serve_upload(filename):
-    """Serve uploaded scan images."""
-    from flask import send_from_directory
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    """Serve uploaded scan images (sharded content keys or legacy flat names).
+
+    ?size=thumb|medium serves a downscaled rendition of an original blob,
+    rendering it on first request if the background pipeline hasn't produced
+    it yet. Legacy flat names have no renditions and are served as-is.
+    """
+    size = request.args.get('size')
+    if size and storage.digest_of(filename) is None and storage.is_safe_key(filename):
+        size = None  # legacy flat name
+    if size:
+        if size not in storage.DERIVATIVE_SIZES:
+            return jsonify({'error': 'Unknown size'}), 400
+        if not storage.is_original(filename):
+            return jsonify({'error': 'Renditions are only available for original images'}), 400
+        if not os.path.isfile(storage.locate(filename)):
+            return jsonify({'error': 'Not found'}), 404
+        filename = storage.make_derivative(filename, size)
+    return _upload_response(filename)
 
 
 # ─── Pest Library ─────────────────────────────────────────────────────────────
@@ -883,7 +1203,22 @@ def api_pest_library():
 
 @bp.route('/api/health', methods=['GET'])
 def api_health():
-    return jsonify({'status': 'ok', 'service': 'agbot-api', 'ai_model': 'EfficientNetB0 Fine-tuned'})
+    ready, report = health.readiness()
+    return jsonify({'status': 'ok', 'service': 'agbot-api', 'ai_model': 'EfficientNetB0 Fine-tuned',
+                    'model_loaded': report['model_loaded'], 'ready': ready})
+
+
+@bp.route('/api/health/live', methods=['GET'])
+def api_health_live():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({'status': 'alive'})
+
+
+@bp.route('/api/health/ready', methods=['GET'])
+def api_health_ready():
+    """Readiness: model warmed up and not saturated; 503 otherwise."""
+    ready, report = health.readiness()
+    return jsonify(report), 200 if ready else 503
 
 
 # NOTE: This module is a Blueprint registered on app.py's Flask app.
@@ -3,34 +3,67 @@ from flask_login import LoginManager, login_user, logout_user, login_required, c
 from flask_cors import CORS
 from datetime import datetime, timedelta
 from functools import wraps
+import click
 import jwt
 import random
 import base64
 import io
 from PIL import Image
 import json
+import logging
 import os
 import sys
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 from models import db, User, Scan, Feedback, PestDatabase
 from sqlalchemy.exc import IntegrityError
+import i18n
+import auth_cache
+import passwords
+import rate_limit
+import result_store
+import storage
+import ingest
+import retention
+import analytics
+import cpu_profiler
+import health
+import logging_config
+import metrics
+import sql_profiler
+import db_config
+import migrations
 
 # Add ml_model to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'ml_model'))
 from model import get_model
 from knowledge_base import get_pest_info_by_name, get_all_pest_names, _load as _load_pest_data_raw
 
+logging_config.configure()
+log = logging.getLogger('agbot.web')
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Change this in production
 CORS(app)
 
+# Reverse proxies in front of the app (nginx, a platform router). Their
+# X-Forwarded-For/-Proto/-Host give request.remote_addr the real client IP,
+# which the per-IP rate-limit buckets key on. 0 = connected directly.
+TRUSTED_PROXIES = int(os.environ.get('AGBOT_TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES,
+                            x_host=TRUSTED_PROXIES)
+
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///agbot.db'
+db_config.configure(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'your-jwt-secret-key'  # Change in production
+app.config['MAX_CONTENT_LENGTH'] = ingest.MAX_CONTENT_LENGTH
 
 # Initialize extensions
 db.init_app(app)
+db_config.install_pragmas(app, db)
 CORS(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -39,24 +72,14 @@ login_manager.login_view = 'login'
 # Mobile API JWT config
 JWT_SECRET = 'your-jwt-secret-key'  # Change in production
 
-# Load translations
-translations = {}
-for lang in ['en', 'es', 'hi', 'sw']:
-    try:
-        with open(f'translations/{lang}.json', 'r', encoding='utf-8') as f:
-            translations[lang] = json.load(f)
-    except FileNotFoundError:
-        print(f"Warning: Translation file for {lang} not found")
-        translations[lang] = {}
-
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return auth_cache.get_user(user_id)
 
 # Helper function for translations
 def get_translation(key, lang='en'):
     keys = key.split('.')
-    value = translations.get(lang, translations['en'])
+    value = i18n.get_translations(lang)
     for k in keys:
         value = value.get(k, key)
     return value
@@ -71,46 +94,30 @@ def inject_translations():
         lang = session.get('language', request.args.get('lang', 'en'))
 
     # Ensure lang is valid
-    if not lang or lang not in translations:
+    if not i18n.is_supported(lang):
         lang = 'en'
 
-    # Get translations for the current language
-    trans = translations.get(lang, translations['en'])
-
-    # Create a simple namespace object for dot notation access
-    class TranslationNamespace:
-        def __init__(self, data):
-            for key, value in data.items():
-                if isinstance(value, dict):
-                    setattr(self, key, TranslationNamespace(value))
-                else:
-                    setattr(self, key, value)
-
-        def __getattr__(self, name):
-            # Return empty string for missing attributes instead of raising error
-            return ''
-
-    t = TranslationNamespace(trans)
+    # Precompiled per-language namespace for dot notation access
+    t = i18n.get_namespace(lang)
 
     return dict(lang=lang, t=t)
 
 # Configuration
-UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-
-# Create upload folder if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-scan_history = []
+app.config['UPLOAD_FOLDER'] = storage.UPLOAD_FOLDER
 
 
 def get_web_dashboard_data(user_id):
     """Build real dashboard data from the database for the web app."""
     from sqlalchemy import extract
 
-    total_scans = Scan.query.filter_by(user_id=user_id).count()
-    healthy_scans = Scan.query.filter_by(user_id=user_id, severity='Healthy').count()
+    # Archived scans (retention.py) only survive as monthly aggregates here
+    archived = retention.archived_totals(user_id)
+    archived_months = retention.archived_monthly_counts(user_id)
+    archived_severity = archived['severity']
+
+    total_scans = Scan.query.filter_by(user_id=user_id).count() + archived['total']
+    healthy_scans = Scan.query.filter_by(user_id=user_id, severity='Healthy').count() + archived['healthy']
     pest_scans = total_scans - healthy_scans
     healthy_pct = round((healthy_scans / total_scans * 100) if total_scans > 0 else 0)
 
@@ -118,7 +125,7 @@ def get_web_dashboard_data(user_id):
         'total_scans': total_scans,
         'healthy_percentage': healthy_pct,
         'pests_detected': pest_scans,
-        'ai_accuracy': 88,
+        'ai_accuracy': analytics.dashboard_accuracy(user_id, default=analytics.MODEL_ACCURACY),
         'model_accuracy': 88.3,
         'inference_time': 0.5
     }
@@ -146,18 +153,20 @@ def get_web_dashboard_data(user_id):
         values.append(Scan.query.filter_by(user_id=user_id).filter(
             extract('month', Scan.created_at) == m,
             extract('year', Scan.created_at) == y
-        ).count())
+        ).count() + archived_months.get(f'{y:04d}-{m:02d}', 0))
     pest_trends = {'months': months, 'values': values}
 
     if total_scans > 0:
-        mild = Scan.query.filter_by(user_id=user_id, severity='Mild').count()
-        moderate = Scan.query.filter_by(user_id=user_id, severity='Moderate').count()
-        high = Scan.query.filter_by(user_id=user_id).filter(Scan.severity.in_(['High', 'Severe'])).count()
+        mild = Scan.query.filter_by(user_id=user_id, severity='Mild').count() + archived_severity.get('Mild', 0)
+        moderate = Scan.query.filter_by(user_id=user_id, severity='Moderate').count() + archived_severity.get('Moderate', 0)
+        high = Scan.query.filter_by(user_id=user_id).filter(Scan.severity.in_(['High', 'Severe'])).count() \
+            + archived_severity.get('High', 0) + archived_severity.get('Severe', 0)
+        severe = Scan.query.filter_by(user_id=user_id, severity='Severe').count() + archived_severity.get('Severe', 0)
         health_distribution = {
             'healthy': round(healthy_scans / total_scans * 100),
             'pest_damage': round((mild + moderate) / total_scans * 100),
             'disease': round(high / total_scans * 100),
-            'critical': round(Scan.query.filter_by(user_id=user_id, severity='Severe').count() / total_scans * 100),
+            'critical': round(severe / total_scans * 100),
         }
     else:
         health_distribution = {'healthy': 0, 'pest_damage': 0, 'disease': 0, 'critical': 0}
@@ -202,6 +211,17 @@ _sample_detections = [
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.errorhandler(passwords.HashingBusy)
+def handle_hashing_busy(e):
+    flash('Server is busy, please try again in a moment', 'warning')
+    response = redirect(request.referrer or url_for('login'))
+    response.headers['Retry-After'] = str(passwords.RETRY_AFTER)
+    return response
+
+app.register_error_handler(rate_limit.RateLimited, rate_limit.error_response)
+app.register_error_handler(rate_limit.Overloaded, rate_limit.error_response)
+app.register_error_handler(RequestEntityTooLarge, ingest.too_large_response)
+
 # Authentication routes
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -412,6 +432,7 @@ def describe():
 
 @app.route('/analyze_symptoms', methods=['POST'])
 @login_required
+@rate_limit.limit('symptoms')
 def analyze_symptoms():
     """Analyze plant symptoms from text description"""
     try:
@@ -434,13 +455,29 @@ def analyze_symptoms():
             status='Analyzed'
         )
         db.session.add(scan)
-        db.session.commit()
-
-        # Store for results page
-        analysis_result['scan_id'] = scan.id
-        session['last_analysis'] = analysis_result
+        with metrics.stage('db_commit'):
+            db.session.commit()
 
-        return jsonify({'success': True, 'redirect': url_for('results')})
+        # Store server-side for the results page; the session only keeps the id
+        result_store.put(current_user.id, scan.id, {
+            'type': 'text',
+            'scan_id': scan.id,
+            'status': 'Analyzed',
+            'pest_identified': analysis_result['disease_name'],
+            'pest_scientific': analysis_result.get('scientific_name', ''),
+            'confidence': analysis_result['confidence'],
+            'damage_pattern': analysis_result.get('description', ''),
+            'severity': analysis_result.get('severity', 'Unknown'),
+            'causes': analysis_result.get('causes', []),
+            'chemical_treatments': analysis_result.get('chemical_treatments', []),
+            'organic_treatments': analysis_result.get('organic_treatments', []),
+            'prevention': analysis_result.get('prevention', []),
+            'user_symptoms': analysis_result.get('user_symptoms', ''),
+            'plant_type': analysis_result.get('plant_type', '')
+        })
+        session['last_scan_id'] = scan.id
+
+        return jsonify({'success': True, 'redirect': url_for('results', scan_id=scan.id)})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -548,10 +585,22 @@ def history():
             s_dict['time'] = ''
         history_data.append(s_dict)
 
-    total = len(history_data)
     pests = sum(1 for h in history_data if h.get('severity') not in ['Healthy', None])
+    archived = retention.archived_totals(current_user.id)
+    total = len(history_data) + archived['total']
+    pests += archived['pests']
     healthy = total - pests
 
+    # Scans past the retention window are only loaded when asked for
+    if request.args.get('include_archived', '').lower() in ('1', 'true', 'yes'):
+        for scan in retention.archived_scans(current_user.id):
+            s_dict = scan.to_dict()
+            s_dict['plant'] = scan.crop_type or 'Unknown Plant'
+            s_dict['pest'] = scan.pest_identified or 'None'
+            s_dict['date'] = scan.created_at.strftime('%Y-%m-%d') if scan.created_at else ''
+            s_dict['time'] = scan.created_at.strftime('%H:%M') if scan.created_at else ''
+            history_data.append(s_dict)
+
     stats = {
         'total_scans': total,
         'pests_found': pests,
@@ -578,44 +627,20 @@ def about():
 
 @app.route('/analyze', methods=['POST'])
 @login_required
+@rate_limit.limit('analyze')
 def analyze():
     """Handle image upload and real AI analysis"""
     try:
-        image_bytes = None
-
-        # Check if file was uploaded
-        if 'image' not in request.files:
-            # Check if base64 image was sent
-            json_data = request.get_json(silent=True)
-            if json_data and 'image_data' in json_data:
-                image_data = json_data['image_data']
-                image_str = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_str)
-            else:
-                return jsonify({'error': 'No image provided'}), 400
-        else:
-            file = request.files['image']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                with open(filepath, 'rb') as f:
-                    image_bytes = f.read()
-            else:
-                return jsonify({'error': 'Invalid file format'}), 400
+        image_bytes = ingest.read_image(request, allowed_file)
+    except ingest.IngestError as e:
+        return jsonify({'error': str(e)}), e.status
 
+    try:
         # Run real AI model inference
         analysis_result = run_pest_detection(image_bytes)
 
-        # Save image
-        from PIL import Image as PILImage
-        img = PILImage.open(io.BytesIO(image_bytes)).convert('RGB')
-        saved_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_scan.jpg"
-        img.save(os.path.join(app.config['UPLOAD_FOLDER'], saved_filename), 'JPEG', quality=85)
-        # Also save as latest_scan.jpg for the results page display
-        img.save(os.path.join(app.config['UPLOAD_FOLDER'], 'latest_scan.jpg'), 'JPEG', quality=85)
+        # Save image (content-addressed, deduplicated)
+        saved_filename = storage.save(image_bytes)
 
         # Save to database
         scan = Scan(
@@ -629,51 +654,31 @@ def analyze():
             damage_pattern=analysis_result.get('damage_pattern', '')
         )
         db.session.add(scan)
-        db.session.commit()
+        with metrics.stage('db_commit'):
+            db.session.commit()
         analysis_result['scan_id'] = scan.id
 
-        # Store result in session for the results page
-        session['last_scan_result'] = analysis_result
+        # Store server-side for the results page; the session only keeps the id
+        result_store.put(current_user.id, scan.id,
+                         dict(analysis_result, type='image', image_path=saved_filename))
+        session['last_scan_id'] = scan.id
 
         return jsonify(analysis_result)
 
+    except rate_limit.Overloaded:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception('Analyze failed')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/results')
 @login_required
 def results():
     """Display analysis results"""
-    # Check for text-based analysis first
-    if 'last_analysis' in session:
-        analysis = session.get('last_analysis')
-        latest_result = {
-            'type': 'text',
-            'status': 'Analyzed',
-            'pest_identified': analysis['disease_name'],
-            'pest_scientific': analysis.get('scientific_name', ''),
-            'confidence': analysis['confidence'],
-            'damage_pattern': analysis.get('description', ''),
-            'severity': analysis.get('severity', 'Unknown'),
-            'causes': analysis.get('causes', []),
-            'chemical_treatments': analysis.get('chemical_treatments', []),
-            'organic_treatments': analysis.get('organic_treatments', []),
-            'prevention': analysis.get('prevention', []),
-            'user_symptoms': analysis.get('user_symptoms', ''),
-            'plant_type': analysis.get('plant_type', '')
-        }
-        session.pop('last_analysis', None)
-    # Check for image scan result
-    elif 'last_scan_result' in session:
-        latest_result = session.get('last_scan_result')
-        latest_result['type'] = 'image'
-        session.pop('last_scan_result', None)
-    elif scan_history:
-        latest_result = scan_history[-1]['result']
-        latest_result['type'] = 'image'
-    else:
+    scan_id = request.args.get('scan_id', type=int) or session.get('last_scan_id')
+    latest_result = result_store.get(current_user.id, scan_id) if scan_id else None
+
+    if latest_result is None:
         latest_result = {
             'type': 'image',
             'status': 'Healthy',
@@ -682,18 +687,19 @@ def results():
             'message': 'No scan performed yet. Go to Scan to analyze a plant.'
         }
 
-    # Add cache-busting timestamp for image
-    import time
-    image_timestamp = int(time.time())
+    image_path = latest_result.get('image_path')
+    # Served from hot or cold storage, with immutable caching for content-named keys
+    image_url = url_for('mobile_api.serve_upload', filename=image_path) if image_path else None
 
     return render_template('results.html', result=latest_result,
-                         image_timestamp=image_timestamp,
+                         image_url=image_url,
                          timestamp=datetime.now().strftime('%m/%d/%Y, %I:%M:%S %p'))
 
 def run_pest_detection(image_bytes):
     """Run real EfficientNetB0 AI model inference on image bytes."""
     model = get_model()
-    predictions = model.predict(image_bytes, top_k=3)
+    with rate_limit.inference_slot(), health.inference():
+        predictions = model.predict(image_bytes, top_k=3)
 
     top = predictions[0]
 
@@ -746,7 +752,8 @@ def run_pest_detection(image_bytes):
         }
 
     # Pest detected — get full info from knowledge base
-    pest_info = get_pest_info_by_name(top['class_name'])
+    with metrics.stage('kb_lookup'):
+        pest_info = get_pest_info_by_name(top['class_name'])
 
     severity = pest_info.get('severity_level', 'Unknown')
     severity_map = {'Low': 'Mild', 'Moderate': 'Moderate', 'High': 'High',
@@ -782,16 +789,53 @@ def run_pest_detection(image_bytes):
 # /api/stats moved to api.py blueprint (hybrid auth)
 
 
+@app.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='List orphaned images without deleting them.')
+def gc_uploads(dry_run):
+    """Delete stored scan images that no scan references any more."""
+    removed = storage.collect_garbage(dry_run=dry_run)
+    for key in removed:
+        print(('would remove ' if dry_run else 'removed ') + key)
+    print(f"{len(removed)} orphaned image(s)")
+
+
+@app.cli.command('migrate')
+@click.option('--status', 'show_status', is_flag=True, help='List migrations and whether each is applied.')
+@click.option('--target', type=int, default=None, help='Stop after this schema version.')
+def migrate(show_status, target):
+    """Apply pending database schema migrations."""
+    if show_status:
+        for version, name, applied in migrations.status(db.engine):
+            print(f"{version:03d} {name:<30} {'applied' if applied else 'pending'}")
+        return
+    db.create_all()
+    applied = migrations.upgrade(db.engine, target=target)
+    print(f"Schema at version {migrations.current_version(db.engine)} ({len(applied)} applied)")
+
+
+@app.cli.command('archive-scans')
+@click.option('--days', type=int, default=None, help='Archive scans older than this (default AGBOT_RETENTION_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Scans moved per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only count the scans that would be archived.')
+def archive_scans(days, batch_size, dry_run):
+    """Move old scans to the archive table and their images to cold storage."""
+    count = retention.archive_scans(days=days, batch_size=batch_size, dry_run=dry_run)
+    print(f"{count} scan(s) {'eligible for archiving' if dry_run else 'archived'}")
+
+
 # Register the mobile API blueprint (provides /api/auth/*, /api/dashboard, /api/analyze, etc.)
 from api import bp as mobile_api_bp
 app.register_blueprint(mobile_api_bp)
+metrics.init_app(app)
+sql_profiler.init_app(app)
+cpu_profiler.init_app(app)
+health.init_app(app, get_model)
 
 
-if __name__ == '__main__':
-    # Initialize database
+def init_database():
+    """Create/upgrade the schema and seed the sample pests (dev server and wsgi.py)."""
+    migrations.upgrade_on_startup(app, db)
     with app.app_context():
-        db.create_all()
-
         # Add sample pests if database is empty
         if PestDatabase.query.count() == 0:
             pests = [
@@ -840,9 +884,13 @@ if __name__ == '__main__':
             db.session.commit()
             print("Database initialized with sample pests")
 
-    # Pre-load the AI model at startup
-    print("\n  Loading AI Model...")
-    get_model()
+
+if __name__ == '__main__':
+    init_database()
+
+    # Load and warm up the AI model in the background; /api/health/ready reports when it's done
+    print("\n  Warming up AI Model in the background...")
+    health.start_warmup(get_model)
 
     print("\n  AGBOT Web Server (AI-Powered)")
     print("  ─────────────────────────────")
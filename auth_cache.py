@@ -0,0 +1,118 @@
+"""
+auth_cache.py — Short-lived caches for authenticated-user resolution.
+
+token_required (api.py) and the Flask-Login user_loader (app.py) resolve
+the current user on every request. Verified JWT payloads are memoized per
+token, and a snapshot of the user's columns is cached per user id, so a
+warm request resolves its user without touching the database.
+
+Any ORM update or delete of a User evicts that user's snapshot, but only
+in the process that made the change. Other gunicorn workers revalidate
+their whole cache at most once every AGBOT_USER_CHECK_INTERVAL seconds,
+with one batched query of the cached users' credentials: if the password
+hash or is_active changed, or the user was deleted, the snapshot is
+dropped. A revoked user is therefore refused by every worker within that
+interval. Other profile columns (name, language, ...) can be up to
+AGBOT_USER_CACHE_TTL seconds stale in the other workers.
+"""
+
+import os
+import threading
+import time
+
+import jwt
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from cache import TTLCache
+from models import db, User
+
+TOKEN_CACHE_TTL = int(os.environ.get('AGBOT_TOKEN_CACHE_TTL', 300))
+USER_CACHE_TTL = int(os.environ.get('AGBOT_USER_CACHE_TTL', 30))  # max staleness of profile columns in other workers
+USER_CHECK_INTERVAL = float(os.environ.get('AGBOT_USER_CHECK_INTERVAL', 5))  # max staleness of credentials
+
+_tokens = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)   # token -> verified payload
+_users = TTLCache(maxsize=2048, ttl=USER_CACHE_TTL)     # user id -> column snapshot
+_next_check = 0.0
+_check_lock = threading.Lock()
+
+# Users per IN (...) list; stays under SQLite's bound-parameter limit
+_CHECK_CHUNK = 500
+
+
+def decode_token(token, secret):
+    """Verify a JWT, memoizing the payload until it expires (or the cache TTL).
+
+    Raises jwt.ExpiredSignatureError / jwt.InvalidTokenError like jwt.decode.
+    """
+    payload = _tokens.get(token)
+    if payload is not None and payload.get('exp', 0) > time.time():
+        return payload
+    payload = jwt.decode(token, secret, algorithms=['HS256'])
+    remaining = payload.get('exp', 0) - time.time()
+    _tokens.set(token, payload, ttl=min(TOKEN_CACHE_TTL, remaining))
+    return payload
+
+
+def _snapshot(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def _revalidate():
+    """Drop snapshots whose credentials changed, or whose user was deleted, in any worker."""
+    ids = _users.keys()
+    current = {}
+    for i in range(0, len(ids), _CHECK_CHUNK):
+        rows = db.session.execute(select(User.id, User.password_hash, User.is_active)
+                                  .where(User.id.in_(ids[i:i + _CHECK_CHUNK])))
+        current.update((row.id, (row.password_hash, row.is_active)) for row in rows)
+    for user_id in ids:
+        snapshot = _users.get(user_id)
+        if snapshot is not None and current.get(user_id) != (snapshot['password_hash'], snapshot['is_active']):
+            invalidate_user(user_id)
+
+
+def _maybe_revalidate():
+    global _next_check
+    now = time.monotonic()
+    if now < _next_check or not _check_lock.acquire(blocking=False):
+        return
+    try:
+        if now >= _next_check:
+            _next_check = now + USER_CHECK_INTERVAL
+            _revalidate()
+    finally:
+        _check_lock.release()
+
+
+def get_user(user_id):
+    """Return the User for user_id attached to the current session, or None."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    _maybe_revalidate()
+    snapshot = _users.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            _users.set(user_id, _snapshot(user))
+        return user
+
+    # Rebuild a detached instance from the snapshot and attach it without a
+    # SELECT; later writes on it flush as normal UPDATEs.
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user_id):
+    """Drop the cached snapshot for a user."""
+    _users.pop(user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _evict_changed_user(mapper, connection, target):
+    invalidate_user(target.id)
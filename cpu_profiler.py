@@ -0,0 +1,242 @@
+"""
+cpu_profiler.py — Opt-in statistical CPU profiles of individual requests.
+
+A request is profiled when it carries `X-Agbot-Profile: <AGBOT_PROFILE_TOKEN>`
+or is picked by the sampling rate AGBOT_PROFILE_SAMPLE (default 0). One
+background thread samples the Python stack of every profiled request's
+thread every AGBOT_PROFILE_INTERVAL_MS (default 5 ms). The request thread
+itself does no extra work. Time spent inside C code (PIL decoding, torch
+kernels, SQLite) is charged to the Python frame that called it, e.g.
+model.py:_predict_trained -> torch/nn/modules/module.py:_call_impl.
+
+Each profile is saved to AGBOT_PROFILE_DIR (default instance/profiles) in
+the folded-stack format read by flamegraph.pl, speedscope and inferno:
+
+    app.py:analyze;ml_model/model.py:predict;... 42
+
+Overhead and disk use are bounded:
+- at most AGBOT_PROFILE_MAX_CONCURRENT requests are profiled at once;
+- a profile stops sampling after AGBOT_PROFILE_MAX_SECONDS;
+- only the newest AGBOT_PROFILE_KEEP profiles are kept.
+
+Profiled responses carry X-Profile-Id. GET /debug/profiles lists the saved
+profiles, and GET /debug/profiles/<id> downloads one. Both need
+`Authorization: Bearer <AGBOT_PROFILE_TOKEN>` and return 404 when no
+token is set.
+"""
+
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import Response, abort, g, jsonify, request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROFILE_TOKEN = os.environ.get('AGBOT_PROFILE_TOKEN', '')
+PROFILE_SAMPLE = float(os.environ.get('AGBOT_PROFILE_SAMPLE', 0))
+PROFILE_INTERVAL = int(os.environ.get('AGBOT_PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_MAX_SECONDS = float(os.environ.get('AGBOT_PROFILE_MAX_SECONDS', 30))
+PROFILE_MAX_CONCURRENT = int(os.environ.get('AGBOT_PROFILE_MAX_CONCURRENT', 2))
+PROFILE_KEEP = int(os.environ.get('AGBOT_PROFILE_KEEP', 50))
+PROFILE_DIR = os.environ.get('AGBOT_PROFILE_DIR') or os.path.join(BASE_DIR, 'instance', 'profiles')
+
+_log = logging.getLogger('agbot.profiler')
+
+
+def _short_path(path):
+    marker = 'site-packages' + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    if path.startswith(BASE_DIR + os.sep):
+        return os.path.relpath(path, BASE_DIR)
+    return os.path.basename(path)
+
+
+def _folded(frame):
+    """Root-first 'file:function;...' for a frame, in folded-stack form."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{_short_path(code.co_filename)}:{code.co_name}'.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profile:
+    def __init__(self, thread_id):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+        self.thread_id = thread_id
+        self.started = time.monotonic()
+        self.stacks = Counter()
+        self.samples = 0
+
+
+class _Sampler:
+    """One thread that samples every active profile's thread."""
+
+    def __init__(self):
+        self._active = {}  # thread id -> Profile
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            if len(self._active) >= PROFILE_MAX_CONCURRENT or thread_id in self._active:
+                return None
+            profile = self._active[thread_id] = Profile(thread_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cpu-profiler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+            return profile
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Sample under the lock, so a profile never changes after stop() returns
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                frames = sys._current_frames()
+                now = time.monotonic()
+                for profile in self._active.values():
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None and now - profile.started < PROFILE_MAX_SECONDS:
+                        profile.stacks[_folded(frame)] += 1
+                        profile.samples += 1
+                frames = frame = None  # drop frame references promptly
+            time.sleep(PROFILE_INTERVAL)
+
+
+_sampler = _Sampler()
+
+
+# ─── Storage ────────────────────────────────────────────────────────────────────
+
+def _save(profile, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile.id)
+    with open(base + '.folded', 'w') as f:
+        for stack, count in profile.stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    with open(base + '.json', 'w') as f:
+        json.dump(meta, f)
+    _prune()
+
+
+def _prune():
+    metas = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for name in metas[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else metas:
+        for ext in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-5] + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Saved profile metadata, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(PROFILE_DIR, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return profiles
+
+
+# ─── Flask wiring ───────────────────────────────────────────────────────────────
+
+def _token_ok(supplied):
+    # Compare bytes: compare_digest raises TypeError on non-ASCII str, and
+    # header values are decoded as latin-1
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(supplied.encode('latin-1'), PROFILE_TOKEN.encode())
+
+
+def _before_request():
+    requested = _token_ok(request.headers.get('X-Agbot-Profile', ''))
+    if requested or (PROFILE_SAMPLE and random.random() < PROFILE_SAMPLE):
+        profile = _sampler.start(threading.get_ident())
+        if profile is not None:
+            g.cpu_profile = profile
+
+
+def _after_request(response):
+    profile = g.get('cpu_profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+        g.cpu_profile_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    profile = g.pop('cpu_profile', None)
+    if profile is None:
+        return
+    _sampler.stop(profile)
+    meta = {
+        'id': profile.id,
+        'method': request.method,
+        'endpoint': request.url_rule.rule if request.url_rule is not None else request.path,
+        'status': g.pop('cpu_profile_status', 500),
+        'duration_ms': round((time.monotonic() - profile.started) * 1000, 1),
+        'samples': profile.samples,
+        'interval_ms': PROFILE_INTERVAL * 1000,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    try:
+        _save(profile, meta)
+    except OSError as e:
+        _log.warning('Could not save CPU profile', extra={'profile_id': profile.id, 'error': str(e)})
+
+
+def _require_token():
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not PROFILE_TOKEN:
+        abort(404)
+    if not _token_ok(supplied):
+        abort(401)
+
+
+def profiles_index():
+    _require_token()
+    return jsonify({'profiles': [dict(p, url=f"/debug/profiles/{p['id']}") for p in list_profiles()]})
+
+
+def profile_download(profile_id):
+    _require_token()
+    path = os.path.join(PROFILE_DIR, os.path.basename(profile_id) + '.folded')
+    if not os.path.isfile(path):
+        abort(404)
+    with open(path) as f:
+        body = f.read()
+    return Response(body, mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={profile_id}.folded'})
+
+
+def init_app(app):
+    """Install the profiling hooks and the /debug/profiles routes."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/debug/profiles', 'cpu_profiles', profiles_index, methods=['GET'])
+    app.add_url_rule('/debug/profiles/<profile_id>', 'cpu_profile', profile_download, methods=['GET'])
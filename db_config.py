@@ -0,0 +1,84 @@
+"""
+db_config.py — Database URL and engine tuning.
+
+The URL comes from AGBOT_DATABASE_URL (or DATABASE_URL, as set by most
+hosts) and defaults to the bundled SQLite file.
+
+SQLite connections are switched to WAL, so readers no longer block on a
+writer and "database is locked" errors go away under concurrent scans.
+They also use synchronous=NORMAL (safe with WAL), a busy timeout instead
+of failing at once, and a larger page cache and mmap window. Server
+databases (PostgreSQL, MySQL) get a sized connection pool with pre-ping,
+so stale connections are replaced instead of erroring.
+"""
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:///agbot.db'
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('AGBOT_SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('AGBOT_SQLITE_CACHE_SIZE_KB', 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get('AGBOT_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+DB_POOL_SIZE = int(os.environ.get('AGBOT_DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('AGBOT_DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('AGBOT_DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('AGBOT_DB_POOL_RECYCLE', 1800))
+
+
+def database_url():
+    url = os.environ.get('AGBOT_DATABASE_URL') or os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given URL."""
+    if is_sqlite(url):
+        # Python's sqlite3 has its own busy wait (seconds); keep it in step with the pragma
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Apply the per-connection SQLite tuning (also used by db_stress.py)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+def configure(app):
+    """Point app at the configured database. Call before db.init_app(app)."""
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+
+
+def install_pragmas(app, db):
+    """Register the SQLite pragmas on the app's engine. Call after db.init_app(app)."""
+    if not is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    with app.app_context():
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
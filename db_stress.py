@@ -0,0 +1,125 @@
+"""
+db_stress.py — SQLite concurrency stress test for the db_config tuning.
+
+Runs the same mixed workload twice against a scratch copy of the schema:
+once with a stock engine (rollback journal, sqlite3's default 5 s lock wait) and once
+with the WAL + busy_timeout pragmas from db_config. Writer threads insert
+scans the way /api/analyze does. Reader threads run the history and
+dashboard queries. Prints throughput and the number of
+"database is locked" errors for each run.
+
+    python db_stress.py                     # 8 writers, 16 readers, 10 s each
+    python db_stress.py --writers 16 --readers 32 --seconds 20
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.exc import OperationalError
+
+import db_config
+from models import db, Scan, User
+
+
+def _make_engine(path, tuned):
+    if tuned:
+        engine = create_engine(f'sqlite:///{path}', **db_config.engine_options('sqlite://'))
+        event.listen(engine, 'connect', db_config.set_sqlite_pragmas)
+    else:
+        # Unmodified engine, as the app had before db_config
+        engine = create_engine(f'sqlite:///{path}')
+    return engine
+
+
+def _setup(engine, users):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'email': f'stress{i}@example.com', 'password_hash': 'x', 'name': f'Stress {i}',
+             'created_at': datetime.utcnow(), 'is_active': True}
+            for i in range(users)
+        ])
+
+
+def _writer(engine, user_ids, stop, stats, idx):
+    i = 0
+    while not stop.is_set():
+        user_id = user_ids[(idx + i) % len(user_ids)]
+        i += 1
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(Scan.__table__).values(
+                    user_id=user_id, pest_identified='Aphids', confidence=87.5, status='Pest Damaged',
+                    severity='Moderate', created_at=datetime.utcnow(), updated_at=datetime.utcnow()))
+            stats['writes'] += 1
+        except OperationalError as e:
+            stats['write_errors' if 'locked' in str(e) else 'other_errors'] += 1
+
+
+def _reader(engine, user_ids, stop, stats, idx):
+    scans = Scan.__table__
+    i = 0
+    while not stop.is_set():
+        user_id = user_ids[(idx + i) % len(user_ids)]
+        i += 1
+        try:
+            with engine.connect() as conn:
+                conn.execute(select(scans).where(scans.c.user_id == user_id)
+                             .order_by(scans.c.created_at.desc()).limit(50)).all()
+                conn.execute(select(func.count()).select_from(scans).where(scans.c.user_id == user_id)).scalar()
+            stats['reads'] += 1
+        except OperationalError as e:
+            stats['read_errors' if 'locked' in str(e) else 'other_errors'] += 1
+
+
+def run(tuned, writers, readers, seconds, users):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(os.path.join(tmp, 'stress.db'), tuned)
+        _setup(engine, users)
+        user_ids = list(range(1, users + 1))
+
+        stop = threading.Event()
+        per_thread = []
+        threads = []
+        for kind, count, target in (('w', writers, _writer), ('r', readers, _reader)):
+            for idx in range(count):
+                stats = {'writes': 0, 'reads': 0, 'write_errors': 0, 'read_errors': 0, 'other_errors': 0}
+                per_thread.append(stats)
+                threads.append(threading.Thread(target=target, args=(engine, user_ids, stop, stats, idx)))
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+    totals = {key: sum(s[key] for s in per_thread) for key in per_thread[0]}
+    totals['writes_per_s'] = totals['writes'] / seconds
+    totals['reads_per_s'] = totals['reads'] / seconds
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:g}s per run\n")
+    print(f"{'config':<10}{'writes/s':>10}{'reads/s':>10}{'write locked':>14}{'read locked':>13}{'other':>7}")
+    for label, tuned in (('default', False), ('tuned', True)):
+        r = run(tuned, args.writers, args.readers, args.seconds, args.users)
+        print(f"{label:<10}{r['writes_per_s']:>10.0f}{r['reads_per_s']:>10.0f}"
+              f"{r['write_errors']:>14}{r['read_errors']:>13}{r['other_errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+export.py — Streaming scan-history export (JSON, NDJSON, CSV).
+
+Rows are read with a server-side cursor in chunks of EXPORT_CHUNK_SIZE
+(plain column tuples, not ORM objects, so the session's identity map
+doesn't grow). Each chunk is encoded and handed to the response as it
+is produced. Feedback is folded into the same query as a correlated
+count, so there is no per-scan query. Memory stays flat however long
+the history is. Output can optionally be gzip-compressed on the fly.
+Archived scans (retention.py) can be appended after the hot ones. They
+are all older, so the output stays newest-first.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, Scan, Feedback, ArchivedScan
+
+EXPORT_CHUNK_SIZE = int(os.environ.get('AGBOT_EXPORT_CHUNK_SIZE', 500))
+
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_FIELDS = ['id', 'created_at', 'updated_at', 'pest_identified', 'pest_scientific', 'confidence',
+              'status', 'severity', 'crop_type', 'field_name', 'damage_pattern', 'image_path',
+              'feedback_count', 'archived']
+
+_COLUMN_NAMES = ['id', 'image_path', 'pest_identified', 'pest_scientific', 'confidence', 'status',
+                 'severity', 'damage_pattern', 'crop_type', 'field_name', 'created_at', 'updated_at']
+
+
+def parse_date(value, end=False):
+    """Parse a from/to filter ('2025-03-01' or a full ISO timestamp).
+
+    A bare date used as an upper bound covers that whole day.
+    Raises ValueError for anything else.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _query(model, user_id, start=None, end=None):
+    if model is ArchivedScan:
+        feedback_count = ArchivedScan.feedback_count
+    else:
+        feedback_count = (select(func.count(Feedback.id))
+                          .where(Feedback.scan_id == Scan.id)
+                          .correlate(Scan)
+                          .scalar_subquery())
+    columns = [getattr(model, name) for name in _COLUMN_NAMES]
+    stmt = select(*columns, feedback_count.label('feedback_count')).where(model.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(model.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(model.created_at < end)
+    return stmt.order_by(model.created_at.desc(), model.id.desc())
+
+
+def iter_rows(user_id, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE, include_archived=False):
+    """Yield lists of scan dicts, chunk_size at a time, newest first."""
+    for model in (Scan, ArchivedScan) if include_archived else (Scan,):
+        result = db.session.execute(
+            _query(model, user_id, start, end).execution_options(stream_results=True, yield_per=chunk_size))
+        try:
+            for partition in result.partitions():
+                yield [_to_dict(row, model is ArchivedScan) for row in partition]
+        finally:
+            result.close()
+
+
+def _to_dict(row, archived=False):
+    """Same shape as Scan.to_dict() / ArchivedScan.to_dict(), plus feedback_count."""
+    image_path = row.image_path
+    return {
+        'id': row.id,
+        'image_path': image_path,
+        'image_urls': {
+            'original': f'/api/uploads/{image_path}',
+            'thumb': f'/api/uploads/{image_path}?size=thumb',
+            'medium': f'/api/uploads/{image_path}?size=medium',
+        } if image_path else None,
+        'pest_identified': row.pest_identified,
+        'pest_scientific': row.pest_scientific,
+        'confidence': row.confidence,
+        'status': row.status,
+        'severity': row.severity,
+        'damage_pattern': row.damage_pattern,
+        'crop_type': row.crop_type,
+        'field_name': row.field_name,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+        'has_feedback': (row.feedback_count or 0) > 0,
+        'feedback_count': row.feedback_count or 0,
+        'archived': archived,
+    }
+
+
+def _encode(fmt, chunks):
+    """Encode chunks of dicts into text pieces for the given format."""
+    if fmt == 'json':
+        yield '['
+        sep = ''
+        for rows in chunks:
+            if rows:
+                yield sep + ','.join(json.dumps(row) for row in rows)
+                sep = ','
+        yield ']'
+    elif fmt == 'ndjson':
+        for rows in chunks:
+            yield ''.join(json.dumps(row) + '\n' for row in rows)
+    else:
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+
+def _gzip(pieces):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for piece in pieces:
+        out = compressor.compress(piece.encode())
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def generate(user_id, fmt='json', start=None, end=None, compress=False, include_archived=False):
+    """Generator of response body pieces (bytes if compressed, else str)."""
+    pieces = _encode(fmt, iter_rows(user_id, start, end, include_archived=include_archived))
+    return _gzip(pieces) if compress else pieces
@@ -0,0 +1,44 @@
+"""
+gunicorn.conf.py — Production server settings (the app side is in wsgi.py).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Configuration (environment):
+    PORT                    listen port (default 5002)
+    AGBOT_WORKERS           worker processes (default min(4, CPU count))
+    AGBOT_WORKER_THREADS    request threads per worker (default 4)
+    AGBOT_TORCH_THREADS     torch intra-op threads per worker (default CPU count / workers)
+    AGBOT_WORKER_TIMEOUT    seconds before a stuck worker is restarted (default 60)
+    AGBOT_MAX_REQUESTS      recycle a worker after this many requests (default 0 = never)
+    AGBOT_TRUSTED_PROXIES   proxies in front whose X-Forwarded-* are trusted (default 1 here,
+                            0 for `python app.py`); set 0 if clients connect to gunicorn directly
+
+Graceful reloads:
+    kill -HUP <master>    replace the workers one by one (new settings, same preloaded code)
+    kill -USR2 <master>   start a new master with the new code, then
+                          kill -WINCH <old master> and kill -QUIT <old master>
+"""
+
+import os
+
+# Production runs behind nginx or a platform router; read in app.py at preload
+os.environ.setdefault('AGBOT_TRUSTED_PROXIES', '1')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5002)}"
+workers = int(os.environ.get('AGBOT_WORKERS', min(4, os.cpu_count() or 1)))
+worker_class = 'gthread'
+threads = int(os.environ.get('AGBOT_WORKER_THREADS', 4))
+
+# Load the model once in the master; workers share it copy-on-write (see wsgi.py)
+preload_app = True
+
+timeout = int(os.environ.get('AGBOT_WORKER_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('AGBOT_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.post_fork(server.cfg.workers)
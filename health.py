@@ -0,0 +1,157 @@
+"""
+health.py — Liveness, readiness and model warm-up.
+
+Liveness (/api/health/live) only says the process can answer requests.
+Readiness (/api/health/ready) is 200 once this worker has loaded the model
+and run a warm-up inference. The warm-up runs in a background thread, so
+the first real scan doesn't pay for the model load. It is started by the
+server entry point and, in any worker that hasn't started one yet (for
+example after a fork), by the first request. CLI commands that import
+the app never load the model. A failed warm-up (a transient OOM, a
+checkpoint still being written) is retried by a later request, after a
+backoff that doubles from WARMUP_RETRY_SECONDS up to WARMUP_RETRY_MAX.
+
+Readiness also reports load. Every inference runs inside `inference()`,
+which tracks how many are in flight and their recent latencies. A worker
+reports itself saturated (503), so a load balancer routes new scans
+elsewhere, when:
+- in-flight inferences reach AGBOT_READY_MAX_INFLIGHT (default 4); or
+- recent p95 inference latency exceeds AGBOT_READY_MAX_P95_MS (0 = off).
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image
+
+import metrics
+
+READY_MAX_INFLIGHT = int(os.environ.get('AGBOT_READY_MAX_INFLIGHT', 4))
+READY_MAX_P95_MS = float(os.environ.get('AGBOT_READY_MAX_P95_MS', 0))
+LATENCY_WINDOW = 60  # seconds of inference latencies that count as "recent"
+WARMUP_RETRY_SECONDS = float(os.environ.get('AGBOT_WARMUP_RETRY_SECONDS', 5))
+WARMUP_RETRY_MAX = 300
+
+_log = logging.getLogger('agbot.health')
+
+_lock = threading.Lock()
+_in_flight = 0
+_latencies = deque(maxlen=200)  # (finished_at, seconds)
+
+_state = {'pid': None, 'model_loaded': False, 'warmed_up': False,
+          'warmup_seconds': None, 'error': None, 'attempts': 0, 'retry_at': None}
+
+
+# ─── Warm-up ────────────────────────────────────────────────────────────────────
+
+def _warmup_image():
+    buf = io.BytesIO()
+    Image.new('RGB', (256, 256), (90, 140, 60)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def _warm_up(get_model):
+    started = time.perf_counter()
+    try:
+        model = get_model()
+        _state['model_loaded'] = True
+        model.predict(_warmup_image())
+    except Exception as e:
+        delay = min(WARMUP_RETRY_MAX, WARMUP_RETRY_SECONDS * 2 ** (_state['attempts'] - 1))
+        _state['retry_at'] = time.monotonic() + delay
+        _state['error'] = f'{type(e).__name__}: {e}'
+        _log.exception('Model warm-up failed', extra={'attempt': _state['attempts'], 'retry_in': delay})
+        return
+    _state['warmup_seconds'] = round(time.perf_counter() - started, 3)
+    _state['warmed_up'] = True
+    _log.info('Model warmed up', extra={'seconds': _state['warmup_seconds']})
+
+
+def start_warmup(get_model):
+    """Warm the model up in the background, once per process (again after a failure's backoff)."""
+    with _lock:
+        if _state['pid'] == os.getpid():
+            retry_at = _state['retry_at']
+            if _state['error'] is None or retry_at is None or time.monotonic() < retry_at:
+                return
+            attempts = _state['attempts']
+        else:
+            attempts = 0  # first call in this process (e.g. a freshly forked worker)
+        _state.update(pid=os.getpid(), model_loaded=False, warmed_up=False,
+                      warmup_seconds=None, error=None, attempts=attempts + 1, retry_at=None)
+    threading.Thread(target=_warm_up, args=(get_model,), name='model-warmup', daemon=True).start()
+
+
+# ─── Inference load ─────────────────────────────────────────────────────────────
+
+@contextmanager
+def inference():
+    """Wrap a model inference so readiness can see queue depth and latency."""
+    global _in_flight
+    with _lock:
+        _in_flight += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        finished = time.perf_counter()
+        with _lock:
+            _in_flight -= 1
+            _latencies.append((time.monotonic(), finished - started))
+
+
+def in_flight():
+    return _in_flight
+
+
+def recent_latency():
+    cutoff = time.monotonic() - LATENCY_WINDOW
+    with _lock:
+        values = sorted(seconds for finished, seconds in _latencies if finished >= cutoff)
+    if not values:
+        return {'count': 0, 'p50_ms': None, 'p95_ms': None}
+    return {
+        'count': len(values),
+        'p50_ms': round(values[len(values) // 2] * 1000, 1),
+        'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 1),
+    }
+
+
+def readiness():
+    """(ready, report) for this worker."""
+    latency = recent_latency()
+    saturated = _in_flight >= READY_MAX_INFLIGHT or bool(
+        READY_MAX_P95_MS and latency['p95_ms'] is not None and latency['p95_ms'] > READY_MAX_P95_MS)
+    ready = _state['warmed_up'] and not saturated
+    if ready:
+        status = 'ready'
+    elif _state['warmed_up']:
+        status = 'saturated'
+    else:
+        status = 'failed' if _state['error'] else 'warming_up'
+    return ready, {
+        'status': status,
+        'pid': os.getpid(),
+        'model_loaded': _state['model_loaded'],
+        'warmed_up': _state['warmed_up'],
+        'warmup_seconds': _state['warmup_seconds'],
+        'error': _state['error'],
+        'warmup_attempts': _state['attempts'],
+        'saturated': saturated,
+        'inference': {
+            'in_flight': _in_flight,
+            'max_in_flight': READY_MAX_INFLIGHT,
+            'recent': latency,
+        },
+    }
+
+
+def init_app(app, get_model):
+    """Warm up on the first request of each worker, and report in-flight inferences in /metrics."""
+    metrics.register_queue('inference', in_flight)
+    app.before_request(lambda: start_warmup(get_model))
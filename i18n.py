@@ -0,0 +1,95 @@
+"""
+i18n.py — Shared translation loading for the web app and mobile API.
+
+Translation files are read once per process. Templates get a precompiled,
+read-only TranslationNamespace per language so the context processor only
+has to pick the right one.
+"""
+
+import json
+import logging
+import os
+import threading
+
+_TRANSLATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translations')
+
+SUPPORTED_LANGUAGES = ['en', 'es', 'hi', 'sw']
+DEFAULT_LANGUAGE = 'en'
+
+_translations: dict | None = None
+_namespaces: dict = {}
+_lock = threading.Lock()
+_log = logging.getLogger('agbot.i18n')
+
+
+class TranslationNamespace:
+    """Read-only dot-notation view over a translation tree (t.nav.home)."""
+
+    def __init__(self, data):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                value = TranslationNamespace(value)
+            object.__setattr__(self, key, value)
+
+    def __getattr__(self, name):
+        # Return empty string for missing attributes instead of raising error
+        return ''
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TranslationNamespace is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('TranslationNamespace is read-only')
+
+
+def _load_file(lang):
+    path = os.path.join(_TRANSLATIONS_DIR, f'{lang}.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        _log.warning('Translation file not found', extra={'lang': lang})
+        return {}
+
+
+def _load():
+    global _translations
+    if _translations is None:
+        with _lock:
+            if _translations is None:
+                _translations = {lang: _load_file(lang) for lang in SUPPORTED_LANGUAGES}
+    return _translations
+
+
+def is_supported(lang) -> bool:
+    """Return True if translations exist for the given language code."""
+    return bool(lang) and lang in _load()
+
+
+def get_translations(lang) -> dict:
+    """Return the raw translation dict for a language (falls back to English)."""
+    data = _load()
+    return data.get(lang) or data[DEFAULT_LANGUAGE]
+
+
+def get_namespace(lang) -> TranslationNamespace:
+    """Return the compiled TranslationNamespace for a language, building it on first use."""
+    if not is_supported(lang):
+        lang = DEFAULT_LANGUAGE
+    ns = _namespaces.get(lang)
+    if ns is None:
+        with _lock:
+            ns = _namespaces.get(lang)
+            if ns is None:
+                ns = TranslationNamespace(_load()[lang])
+                _namespaces[lang] = ns
+    return ns
+
+
+def reload_translations():
+    """Re-read translation files and drop compiled namespaces (e.g. after editing JSON)."""
+    global _translations
+    fresh = {lang: _load_file(lang) for lang in SUPPORTED_LANGUAGES}
+    with _lock:
+        _translations = fresh
+        _namespaces.clear()
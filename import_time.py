@@ -0,0 +1,139 @@
+"""
+import_time.py — Import-time report and regression guard for the server modules.
+
+Imports each target module in a fresh interpreter under `python -X importtime`
+and reports:
+  - the total time to import it (best of --repeat runs)
+  - its slowest direct imports, with their cumulative time
+  - any module from HEAVY_MODULES that got imported
+
+torch and torchvision are in HEAVY_MODULES. They must load only when the
+model is first used (see ml_model/model.py), not when something imports
+the app. Otherwise migrate_db.py and every CLI command spend seconds
+importing torch. A heavy import, a target over --max-ms, or (with
+--baseline) a target more than --tolerance slower than an earlier run's
+JSON makes the exit status 1, so it can gate CI.
+
+    python import_time.py                          # app and migrate_db
+    python import_time.py --output imports.json
+    python import_time.py --baseline imports.json --tolerance 0.3
+    python import_time.py api --top 20 --max-ms 1500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_TARGETS = ('app', 'migrate_db')
+HEAVY_MODULES = ('torch', 'torchvision')
+TOLERANCE = 0.25  # import times are noisy; 25% slower than baseline counts as a regression
+
+
+def _parse(stderr):
+    """[(depth, module, self_us, cumulative_us)] in the order -X importtime prints them."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        stripped = name.lstrip(' ')
+        depth = (len(name) - len(stripped) - 1) // 2
+        rows.append((depth, stripped.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def _import_once(target):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+                            cwd=BASE_DIR, capture_output=True, text=True,
+                            env=dict(os.environ, AGBOT_LOG_LEVEL='WARNING'))
+    if result.returncode != 0:
+        raise SystemExit(f"import {target} failed:\n{result.stderr[-2000:]}")
+    rows = _parse(result.stderr)
+    # The target's record comes after its dependencies, and earlier depth-0 records
+    # (interpreter startup) and later ones (imports at exit) aren't part of it
+    ends = [i for i, (depth, name, _, _) in enumerate(rows) if depth == 0 and name == target]
+    if not ends:
+        raise SystemExit(f"No -X importtime record for {target}")
+    start = max((i + 1 for i, row in enumerate(rows[:ends[-1]]) if row[0] == 0), default=0)
+    return rows[start:ends[-1] + 1]
+
+
+def measure(target, repeat=3, top=10):
+    """Import `target` `repeat` times and summarize the fastest run."""
+    runs = [_import_once(target) for _ in range(repeat)]
+    rows = min(runs, key=lambda r: r[-1][3])
+    modules = {name for _, name, _, _ in rows}
+    direct = sorted((r for r in rows if r[0] == 1), key=lambda r: r[3], reverse=True)
+    return {
+        'total_ms': round(rows[-1][3] / 1000, 1),
+        'modules': len(modules),
+        'heavy': [m for m in HEAVY_MODULES if m in modules],
+        'slowest': [{'module': name, 'cumulative_ms': round(cumulative / 1000, 1),
+                     'self_ms': round(self_us / 1000, 1)}
+                    for _, name, self_us, cumulative in direct[:top]],
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Targets whose import is more than `tolerance` slower than in the baseline."""
+    regressions = []
+    for target, result in current.items():
+        before = baseline.get('targets', {}).get(target)
+        if not before or not before.get('total_ms'):
+            continue
+        change = (result['total_ms'] - before['total_ms']) / before['total_ms']
+        if change > tolerance:
+            regressions.append({'target': target, 'baseline': before['total_ms'],
+                                'current': result['total_ms'], 'change_pct': round(change * 100, 1)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('targets', nargs='*', default=list(DEFAULT_TARGETS), help='modules to import')
+    parser.add_argument('--repeat', type=int, default=3, help='imports per target; the fastest is kept')
+    parser.add_argument('--top', type=int, default=10, help='slowest direct imports to list')
+    parser.add_argument('--max-ms', type=float, help='fail if any target takes longer than this')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='compare against this results JSON; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    for target in args.targets:
+        result = results[target] = measure(target, args.repeat, args.top)
+        print(f"import {target}: {result['total_ms']:.0f} ms, {result['modules']} modules")
+        for row in result['slowest']:
+            print(f"  {row['module']:<32}{row['cumulative_ms']:>9.1f} ms")
+        if result['heavy']:
+            failures.append(f"import {target} loads {', '.join(result['heavy'])}")
+        if args.max_ms and result['total_ms'] > args.max_ms:
+            failures.append(f"import {target} took {result['total_ms']:.0f} ms (limit {args.max_ms:.0f} ms)")
+        print()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'targets': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for r in compare(results, baseline, args.tolerance):
+            failures.append(f"import {r['target']}: {r['baseline']} -> {r['current']} ms ({r['change_pct']:+.1f}%)")
+
+    if failures:
+        print(f"{len(failures)} import-time problem(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("No import-time problems" + (f" against {args.baseline}" if args.baseline else ''))
+
+
+if __name__ == '__main__':
+    main()
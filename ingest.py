@@ -0,0 +1,262 @@
+"""
+ingest.py — Bounded-memory image ingestion for the analyze endpoints.
+
+Base64 JSON bodies ({"image_data": "data:image/jpeg;base64,..."}) are read
+from the request stream in chunks and decoded incrementally. The raw body
+and the JSON string are never held in memory, and a non-image is rejected
+by its magic bytes after the first chunk. Multipart uploads are sniffed
+before they are read into memory. Every image's header is checked against
+MAX_IMAGE_PIXELS before anything decodes the pixels (decompression bombs).
+
+The overall body size is capped by Flask's MAX_CONTENT_LENGTH, which
+app.py sets from AGBOT_MAX_UPLOAD_MB. app.py also registers
+too_large_response(), so an oversized body on any /api/ endpoint gets a
+JSON 413 rather than Werkzeug's HTML page.
+"""
+
+import binascii
+import base64
+import io
+import os
+import re
+import time
+
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import metrics
+import storage
+
+MAX_CONTENT_LENGTH = int(float(os.environ.get('AGBOT_MAX_UPLOAD_MB', 16)) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(os.environ.get('AGBOT_MAX_IMAGE_PIXELS', 40_000_000))
+
+# Pillow refuses outright at 2x this and warns at 1x; we reject at 1x ourselves
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+CHUNK_SIZE = 64 * 1024
+_SNIFF_BYTES = 16
+_KEY = b'"image_data"'
+_SPECIAL = re.compile(rb'["\\]')
+_WHITESPACE = b' \t\r\n'
+
+
+class IngestError(Exception):
+    """Rejected upload; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def read_image(request, allowed_file):
+    """Return the uploaded image bytes from a multipart or base64 JSON request.
+
+    Raises IngestError (400 missing/invalid, 413 too large, 415 not an image).
+    """
+    try:
+        if 'image' in request.files:
+            with metrics.stage('body_read'):
+                image_bytes = _read_multipart(request.files['image'], allowed_file)
+        elif request.mimetype == 'application/json':
+            image_bytes = _read_base64_json(request.stream)
+        else:
+            raise IngestError('No image provided')
+    except RequestEntityTooLarge:
+        raise IngestError(_too_large_message(request), 413)
+
+    check_pixels(image_bytes)
+    return image_bytes
+
+
+def _too_large_message(request, what='Upload'):
+    limit = request.max_content_length or MAX_CONTENT_LENGTH
+    return f'{what} exceeds {limit / (1024 * 1024):g} MB limit'
+
+
+def too_large_response(e):
+    """JSON 413 for /api/ paths; Werkzeug's own page for the web app."""
+    from flask import request
+
+    if not request.path.startswith('/api/'):
+        return e
+    return {'error': _too_large_message(request, 'Request body')}, 413
+
+
+def _read_multipart(file, allowed_file):
+    if not file or not allowed_file(file.filename):
+        raise IngestError('Invalid file format')
+    # Werkzeug has spooled the part to a temp file; sniff before reading it into memory
+    head = file.stream.read(_SNIFF_BYTES)
+    if storage.sniff_extension(head) is None:
+        raise IngestError('Unsupported image format', 415)
+    file.stream.seek(0)
+    return file.stream.read()
+
+
+def decode_base64_image(image_str):
+    """Decode an in-memory base64 / data-URL image string with the same checks as read_image."""
+    if not isinstance(image_str, str) or not image_str:
+        raise IngestError('No image provided')
+    if ',' in image_str:
+        image_str = image_str.split(',', 1)[1]
+    try:
+        image_bytes = base64.b64decode(image_str.encode().translate(None, _WHITESPACE), validate=True)
+    except binascii.Error:
+        raise IngestError('Invalid base64 image data')
+    if storage.sniff_extension(image_bytes[:_SNIFF_BYTES]) is None:
+        raise IngestError('Unsupported image format', 415)
+    check_pixels(image_bytes)
+    return image_bytes
+
+
+def check_pixels(image_bytes):
+    """Reject images whose declared dimensions exceed MAX_IMAGE_PIXELS (header only)."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            width, height = img.size
+    except Image.DecompressionBombError:
+        raise IngestError('Image dimensions too large', 413)
+    except Exception:
+        raise IngestError('Unsupported image format', 415)
+    if width * height > MAX_IMAGE_PIXELS:
+        raise IngestError('Image dimensions too large', 413)
+
+
+# ─── Streaming base64 JSON ─────────────────────────────────────────────────────
+
+def _chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _string_value_chunks(stream):
+    """Yield the raw contents of the top-level "image_data" JSON string, chunk by chunk."""
+    chunks = _chunks(stream)
+    buf = b''
+
+    # Find the key, keeping enough tail to match across chunk boundaries
+    for chunk in chunks:
+        buf += chunk
+        idx = buf.find(_KEY)
+        if idx >= 0:
+            buf = buf[idx + len(_KEY):]
+            break
+        buf = buf[-len(_KEY):]
+    else:
+        raise IngestError('No image provided')
+
+    # Skip `: "` allowing whitespace
+    seen_colon = False
+    while True:
+        buf = buf.lstrip(_WHITESPACE)
+        if not buf:
+            buf = next(chunks, b'')
+            if not buf:
+                raise IngestError('Malformed JSON body')
+            continue
+        if not seen_colon:
+            if buf[:1] != b':':
+                raise IngestError('Malformed JSON body')
+            seen_colon, buf = True, buf[1:]
+            continue
+        if buf[:1] != b'"':
+            raise IngestError('image_data must be a string')
+        buf = buf[1:]
+        break
+
+    # Stream the string body up to the closing quote, resolving escapes
+    pending_escape = False
+    while True:
+        pos = 0
+        if pending_escape and buf:
+            yield _unescape(buf[:1])
+            pos, pending_escape = 1, False
+        while True:
+            m = _SPECIAL.search(buf, pos)
+            if m is None:
+                if pos < len(buf):
+                    yield buf[pos:]
+                break
+            if m.start() > pos:
+                yield buf[pos:m.start()]
+            if buf[m.start():m.start() + 1] == b'"':
+                return
+            # Backslash escape; the escaped byte may be in the next chunk
+            if m.start() + 1 < len(buf):
+                yield _unescape(buf[m.start() + 1:m.start() + 2])
+                pos = m.start() + 2
+            else:
+                pending_escape = True
+                break
+        buf = next(chunks, b'')
+        if not buf:
+            raise IngestError('Malformed JSON body')
+
+
+def _unescape(ch):
+    if ch in (b'/', b'\\', b'"'):
+        return ch
+    if ch in (b'n', b'r', b't'):
+        return b''  # line breaks inside base64 are ignorable
+    raise IngestError('Invalid base64 image data')
+
+
+def _read_base64_json(stream):
+    # Reading and decoding interleave; time the decode calls and count the rest as body read
+    started = time.perf_counter()
+    decode_seconds = 0.0
+    out = io.BytesIO()
+    carry = b''
+    header = b''
+    header_done = False
+    sniffed = False
+
+    for piece in _string_value_chunks(stream):
+        if not header_done:
+            # Drop an optional data-URL prefix ("data:image/jpeg;base64,")
+            header += piece
+            if header.startswith(b'data:') or b'data:'.startswith(header):
+                comma = header.find(b',')
+                if comma < 0:
+                    if len(header) > 256:
+                        raise IngestError('Invalid base64 image data')
+                    continue
+                piece = header[comma + 1:]
+            else:
+                piece = header
+            header_done = True
+
+        carry += piece.translate(None, _WHITESPACE)
+        usable = len(carry) - len(carry) % 4
+        if usable:
+            decode_started = time.perf_counter()
+            try:
+                out.write(base64.b64decode(carry[:usable], validate=True))
+            except binascii.Error:
+                raise IngestError('Invalid base64 image data')
+            decode_seconds += time.perf_counter() - decode_started
+            carry = carry[usable:]
+            if not sniffed and out.tell() >= _SNIFF_BYTES:
+                # Reject non-images before reading the rest of the body
+                _sniff(out)
+                sniffed = True
+
+    if carry:
+        try:
+            out.write(base64.b64decode(carry + b'=' * (-len(carry) % 4), validate=True))
+        except binascii.Error:
+            raise IngestError('Invalid base64 image data')
+    if out.tell() == 0:
+        raise IngestError('No image provided')
+    _sniff(out)
+    metrics.observe_stage('base64_decode', decode_seconds)
+    metrics.observe_stage('body_read', time.perf_counter() - started - decode_seconds)
+    return out.getvalue()
+
+
+def _sniff(out):
+    if storage.sniff_extension(out.getbuffer()[:_SNIFF_BYTES].tobytes()) is None:
+        raise IngestError('Unsupported image format', 415)
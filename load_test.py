@@ -0,0 +1,399 @@
+"""
+load_test.py — End-to-end HTTP load test for the web app and mobile API.
+
+Starts app.py in a subprocess against scratch state: a temporary SQLite
+database, upload and cold-storage folders, and an unreachable weather
+URL, so nothing touches the network. If ml_model/agbot_model.pth is
+missing, the server loads a checkpoint with the same architecture and
+seeded random weights, so inference costs the same. It then registers
+--users accounts and runs one thread per simulated user for --seconds.
+Each user logs in, then repeatedly picks a request from a weighted mix:
+
+    dashboard, history, chat, login,
+    analyze_multipart (form upload), analyze_base64 (JSON "image_data")
+
+It reports per-endpoint throughput, latency percentiles and error rates,
+and, on Linux, the memory of each server process (RSS, PSS and USS; PSS
+splits pages shared copy-on-write evenly between the processes sharing
+them, so the PSS total is what the server really costs). It can write
+everything as JSON. Rate limiting is off in the started server, since
+every simulated user would soon hit it. --server wsgi runs the production
+entry point (gunicorn + wsgi.py) instead of the dev server, so the two
+modes can be compared. Users are closed-loop: with --think 0, each
+sends its next request as soon as the last one returns. Numbers are for
+one server (one process, or one gunicorn master and its workers), so divide the expected peak load by them to size
+the fleet.
+
+    python load_test.py                               # 20 users, 30 s
+    python load_test.py --users 50 --seconds 60 --think 0.5 --output load.json
+    python load_test.py --mix dashboard=5,analyze_multipart=1
+    python load_test.py --server wsgi --workers 4   # gunicorn, preloaded model
+    python load_test.py --url http://staging:5002     # existing server (accounts are created there)
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINED_MODEL = os.path.join(BASE_DIR, 'ml_model', 'agbot_model.pth')
+
+DEFAULT_MIX = {
+    'dashboard': 30,
+    'history': 25,
+    'chat': 15,
+    'login': 10,
+    'analyze_multipart': 10,
+    'analyze_base64': 10,
+}
+CHAT_MESSAGES = ['How do I treat aphids?', 'What are the symptoms of spider mites?',
+                 'How to prevent whiteflies', 'hello']
+PASSWORD = 'load-test-password'
+IMAGE_POOL = 16
+STARTUP_TIMEOUT = 180
+REQUEST_TIMEOUT = 60
+
+
+# ─── Server ───────────────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, random_weights, mode='dev', workers=None):
+    port = _free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               AGBOT_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+               AGBOT_UPLOAD_DIR=os.path.join(workdir, 'uploads'),
+               AGBOT_COLD_STORAGE_DIR=os.path.join(workdir, 'archive'),
+               WEATHER_API_URL=f'http://127.0.0.1:{_free_port()}/weather',  # nothing listens: fails fast
+               AGBOT_LOG_LEVEL=os.environ.get('AGBOT_LOG_LEVEL', 'WARNING'),
+               AGBOT_RATE_LIMIT=os.environ.get('AGBOT_RATE_LIMIT', '0'))
+    if random_weights:
+        sys.path.insert(0, os.path.join(BASE_DIR, 'ml_model'))
+        from benchmark import write_random_checkpoint
+        env['AGBOT_MODEL_PATH'] = os.path.join(workdir, 'random.pth')
+        write_random_checkpoint(env['AGBOT_MODEL_PATH'])
+
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    if mode == 'wsgi':
+        if workers:
+            env['AGBOT_WORKERS'] = str(workers)
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'), 'wsgi:app']
+    else:
+        command = [sys.executable, os.path.join(BASE_DIR, 'app.py')]
+    proc = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    # Ready once several readiness checks in a row pass (each may hit a different worker)
+    url = f'http://127.0.0.1:{port}'
+    streak = 0
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            log.close()
+            with open(log.name, errors='replace') as f:
+                raise SystemExit(f"Server exited during startup:\n{f.read()[-2000:]}")
+        status, _, _ = _request(f'{url}/api/health/ready')
+        streak = streak + 1 if status == 200 else 0
+        if streak >= 2 * (workers or 1):
+            return proc, url
+        time.sleep(0.25 if status == 200 else 0.5)
+    proc.terminate()
+    raise SystemExit(f"Server was not ready within {STARTUP_TIMEOUT}s (see {log.name})")
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_memory(pid):
+    """MB per server process (and its workers) from /proc/<pid>/smaps_rollup; [] off Linux."""
+    processes = []
+    for p in [pid] + _children(pid):
+        fields = {}
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if value.strip().endswith('kB'):
+                        fields[key] = int(value.split()[0]) / 1024
+        except OSError:
+            continue
+        processes.append({
+            'pid': p,
+            'role': 'server' if p == pid else 'worker',
+            'rss_mb': round(fields.get('Rss', 0), 1),
+            'pss_mb': round(fields.get('Pss', 0), 1),
+            'uss_mb': round(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), 1),
+        })
+    return processes
+
+
+# ─── Client ───────────────────────────────────────────────────────────────────
+
+def _request(url, method='GET', body=None, headers=None):
+    """Return (status, elapsed seconds, parsed JSON or None). status 0 = connection error."""
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            status, raw = resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    except (urllib.error.URLError, OSError):
+        return 0, time.perf_counter() - started, None
+    elapsed = time.perf_counter() - started
+    try:
+        return status, elapsed, json.loads(raw)
+    except ValueError:
+        return status, elapsed, None
+
+
+def _json(payload):
+    return json.dumps(payload).encode(), {'Content-Type': 'application/json'}
+
+
+def _multipart(image):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="leaf.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def make_images(count=IMAGE_POOL, seed=1234):
+    """Distinct phone-sized JPEGs, so content-addressed storage doesn't dedupe every upload."""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        small = Image.new('RGB', (32, 24))
+        small.putdata([(rng.randrange(40, 120), rng.randrange(100, 220), rng.randrange(30, 110))
+                       for _ in range(32 * 24)])
+        buf = io.BytesIO()
+        small.resize((1024, 768), Image.BICUBIC).save(buf, 'JPEG', quality=88)
+        images.append(buf.getvalue())
+    return images
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}  # action -> [seconds]
+        self.errors = {}     # action -> {status: count}
+        self._lock = threading.Lock()
+
+    def record(self, action, status, elapsed):
+        with self._lock:
+            self.latencies.setdefault(action, []).append(elapsed)
+            if not 200 <= status < 300:
+                errors = self.errors.setdefault(action, {})
+                errors[status] = errors.get(status, 0) + 1
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(stats, seconds):
+    rows = {}
+    everything = []
+    for action, values in sorted(stats.latencies.items()):
+        ordered = sorted(values)
+        everything.extend(ordered)
+        errors = sum(stats.errors.get(action, {}).values())
+        rows[action] = {
+            'requests': len(ordered),
+            'rps': round(len(ordered) / seconds, 2),
+            'error_rate': round(errors / len(ordered), 4),
+            'errors_by_status': {str(k): v for k, v in sorted(stats.errors.get(action, {}).items())},
+            'mean_ms': round(statistics.fmean(ordered) * 1000, 1),
+            **{f'p{p}_ms': round(_percentile(ordered, p) * 1000, 1) for p in (50, 90, 95, 99)},
+            'max_ms': round(ordered[-1] * 1000, 1),
+        }
+    everything.sort()
+    total_errors = sum(sum(e.values()) for e in stats.errors.values())
+    overall = {
+        'requests': len(everything),
+        'rps': round(len(everything) / seconds, 2),
+        'error_rate': round(total_errors / len(everything), 4) if everything else 0,
+        **({f'p{p}_ms': round(_percentile(everything, p) * 1000, 1) for p in (50, 90, 95, 99)}
+           if everything else {}),
+    }
+    return overall, rows
+
+
+# ─── Simulated users ──────────────────────────────────────────────────────────
+
+class User:
+    def __init__(self, url, email, images, stats, rng):
+        self.url, self.email, self.images, self.stats, self.rng = url, email, images, stats, rng
+        self.headers = {}
+
+    def login(self):
+        body, headers = _json({'email': self.email, 'password': PASSWORD})
+        status, elapsed, data = _request(f'{self.url}/api/auth/login', 'POST', body, headers)
+        self.stats.record('login', status, elapsed)
+        if status == 200 and data:
+            self.headers = {'Authorization': f"Bearer {data['token']}"}
+        return status == 200
+
+    def dashboard(self):
+        return _request(f'{self.url}/api/dashboard', headers=self.headers)
+
+    def history(self):
+        return _request(f'{self.url}/api/history', headers=self.headers)
+
+    def chat(self):
+        body, headers = _json({'message': self.rng.choice(CHAT_MESSAGES)})
+        return _request(f'{self.url}/api/chat', 'POST', body, {**self.headers, **headers})
+
+    def analyze_multipart(self):
+        body, headers = _multipart(self.rng.choice(self.images))
+        return _request(f'{self.url}/api/analyze', 'POST', body, {**self.headers, **headers})
+
+    def analyze_base64(self):
+        image = base64.b64encode(self.rng.choice(self.images)).decode()
+        body, headers = _json({'image_data': f'data:image/jpeg;base64,{image}'})
+        return _request(f'{self.url}/api/analyze', 'POST', body, {**self.headers, **headers})
+
+    def run(self, actions, weights, stop, think):
+        if not self.login():
+            return
+        while not stop.is_set():
+            action = self.rng.choices(actions, weights)[0]
+            if action == 'login':
+                self.login()
+            else:
+                status, elapsed, _ = getattr(self, action)()
+                self.stats.record(action, status, elapsed)
+            if think:
+                stop.wait(self.rng.expovariate(1 / think))
+
+
+def register_users(url, count, run_id):
+    emails = []
+    for i in range(count):
+        email = f'load-{run_id}-{i}@example.com'
+        body, headers = _json({'name': f'Load {i}', 'email': email, 'password': PASSWORD, 'location': 'Nairobi'})
+        status, _, data = _request(f'{url}/api/auth/register', 'POST', body, headers)
+        if status != 201:
+            raise SystemExit(f"Could not register {email}: {status} {data}")
+        emails.append(email)
+    return emails
+
+
+def run(url, users, seconds, think, mix, seed):
+    images = make_images()
+    emails = register_users(url, users, uuid.uuid4().hex[:8])
+    stats = Stats()
+    stop = threading.Event()
+    actions, weights = list(mix), list(mix.values())
+    threads = [threading.Thread(target=User(url, email, images, stats, random.Random(seed + i)).run,
+                                args=(actions, weights, stop, think), daemon=True)
+               for i, email in enumerate(emails)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join(REQUEST_TIMEOUT)
+    return summarize(stats, time.perf_counter() - started)
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown action {name!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20, help='concurrent simulated users')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--think', type=float, default=0, help='mean think time between requests (s)')
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX, help='e.g. dashboard=30,history=25')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--url', help='target a running server instead of starting one')
+    parser.add_argument('--server', choices=('dev', 'wsgi'), default='dev',
+                        help='start app.py (dev) or gunicorn + wsgi.py (wsgi)')
+    parser.add_argument('--workers', type=int, help='gunicorn workers for --server wsgi')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='serve a random-weight model even if agbot_model.pth exists')
+    parser.add_argument('--output', help='write results JSON here')
+    args = parser.parse_args()
+
+    proc = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            random_weights = args.random_weights or not os.path.exists(TRAINED_MODEL)
+            print(f"Starting {'app.py' if args.server == 'dev' else 'gunicorn'} "
+                  f"({'random-weight' if random_weights else 'trained'} model)...")
+            proc, url = start_server(workdir, random_weights, args.server, args.workers)
+        try:
+            print(f"{args.users} users, {args.seconds:g}s, think {args.think:g}s against {url}\n")
+            memory_idle = process_memory(proc.pid) if proc else []
+            overall, rows = run(url, args.users, args.seconds, args.think, args.mix, args.seed)
+            memory = process_memory(proc.pid) if proc else []
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(10)
+
+    print(f"{'endpoint':<19}{'reqs':>7}{'req/s':>8}{'err %':>7}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for action, r in rows.items():
+        print(f"{action:<19}{r['requests']:>7}{r['rps']:>8.1f}{r['error_rate'] * 100:>7.1f}"
+              f"{r['p50_ms']:>8.0f}{r['p90_ms']:>8.0f}{r['p95_ms']:>8.0f}{r['p99_ms']:>8.0f}{r['max_ms']:>8.0f}")
+    if overall['requests']:
+        print(f"{'total':<19}{overall['requests']:>7}{overall['rps']:>8.1f}{overall['error_rate'] * 100:>7.1f}"
+              f"{overall['p50_ms']:>8.0f}{overall['p90_ms']:>8.0f}{overall['p95_ms']:>8.0f}{overall['p99_ms']:>8.0f}")
+    print("\nLatencies in ms.")
+    for action, r in rows.items():
+        if r['errors_by_status']:
+            print(f"{action} errors by status: {r['errors_by_status']}  (0 = connection error)")
+    if memory:
+        print(f"\n{'process':<16}{'RSS MB':>9}{'PSS MB':>9}{'USS MB':>9}{'idle PSS':>10}")
+        idle = {m['pid']: m['pss_mb'] for m in memory_idle}
+        for m in memory:
+            print(f"{m['role'] + ' ' + str(m['pid']):<16}{m['rss_mb']:>9.0f}{m['pss_mb']:>9.0f}{m['uss_mb']:>9.0f}"
+                  f"{idle.get(m['pid'], 0):>10.0f}")
+        print(f"{'total':<16}{sum(m['rss_mb'] for m in memory):>9.0f}{sum(m['pss_mb'] for m in memory):>9.0f}"
+              f"{sum(m['uss_mb'] for m in memory):>9.0f}{sum(idle.values()):>10.0f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'users': args.users, 'seconds': args.seconds, 'think': args.think, 'mix': args.mix,
+                       'server': None if args.url else args.server, 'workers': args.workers,
+                       'overall': overall, 'endpoints': rows,
+                       'memory': {'idle': memory_idle, 'after_load': memory}}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+logging_config.py — Structured, non-blocking logging for the web apps and ml_model.
+
+configure() attaches a QueueHandler to the 'agbot' logger, so request
+threads only enqueue records. A QueueListener thread formats them and
+writes them to stderr. Each record is one JSON object per line
+(AGBOT_LOG_FORMAT=json, the default) or plain text (AGBOT_LOG_FORMAT=text).
+Anything passed with extra={...} becomes a top-level field.
+
+Loggers:
+  agbot.*                      application modules (level AGBOT_LOG_LEVEL, default INFO)
+  agbot.model                  model loading
+  agbot.model.predictions      per-scan top-5 / decision diagnostics. These
+                               are sampled (AGBOT_PREDICTION_LOG_SAMPLE, default
+                               0.01) and capped at AGBOT_PREDICTION_LOG_PER_MIN
+                               records a minute.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get('AGBOT_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('AGBOT_LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('AGBOT_LOG_QUEUE_SIZE', 10000))
+PREDICTION_LOG_SAMPLE = float(os.environ.get('AGBOT_PREDICTION_LOG_SAMPLE', 0.01))
+PREDICTION_LOG_PER_MIN = int(os.environ.get('AGBOT_PREDICTION_LOG_PER_MIN', 60))
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Pass a random `rate` fraction of records, and at most `per_minute` of them."""
+
+    def __init__(self, rate, per_minute):
+        super().__init__()
+        self.rate = rate
+        self.per_minute = per_minute
+        self._window_start = time.monotonic()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0 or random.random() >= self.rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start, self._count = now, 0
+            if self._count >= self.per_minute:
+                return False
+            self._count += 1
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never block the caller. If the queue is full, the record is dropped."""
+
+    def prepare(self, record):
+        # Resolve args and tracebacks now (they may not pickle or outlive the caller),
+        # but keep them separate so the formatter can still emit structured fields
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def configure():
+    """Install the queue handler on the 'agbot' logger (idempotent)."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+
+        stream = logging.StreamHandler(sys.stderr)
+        if LOG_FORMAT == 'json':
+            stream.setFormatter(JsonFormatter())
+        else:
+            stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+        _listener.start()
+        atexit.register(lambda: _listener.stop())
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+        _handler = _DroppingQueueHandler(log_queue)
+        root = logging.getLogger('agbot')
+        root.setLevel(LOG_LEVEL)
+        root.handlers[:] = [_handler]
+        root.propagate = False
+
+        predictions = logging.getLogger('agbot.model.predictions')
+        predictions.addFilter(SampleFilter(PREDICTION_LOG_SAMPLE, PREDICTION_LOG_PER_MIN))
+
+
+def _restart_after_fork():
+    # The listener thread doesn't survive fork() (e.g. gunicorn --preload); give the child its own
+    global _listener, _lock
+    _lock = threading.Lock()
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=False)
+    _handler.queue = log_queue
+    _listener.start()
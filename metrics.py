@@ -0,0 +1,231 @@
+"""
+metrics.py — In-process metrics and the /metrics endpoint.
+
+A small Prometheus-compatible registry (counters, histograms, gauges read
+at scrape time) with no extra dependencies. init_app() records, for each
+request:
+
+- agbot_http_requests_total{method,endpoint,status}
+- agbot_http_request_duration_seconds{endpoint} (histogram)
+- agbot_db_queries_per_request{endpoint} (histogram), from a SQLAlchemy cursor hook
+
+The scan pipeline reports the time of each stage with `with metrics.stage('...')`
+into agbot_scan_stage_seconds{stage} (histogram):
+
+    body_read, base64_decode, image_decode, transform, forward,
+    kb_lookup, image_store, derivative_render, db_commit
+
+It also reports model cache hits and misses (agbot_model_cache_total{result})
+and the depth of the background queues (agbot_queue_depth{queue}).
+
+/metrics serves the text exposition format. Set AGBOT_METRICS_TOKEN to
+require `Authorization: Bearer <token>`. Counts are per process; with
+several workers, scrape each one or aggregate upstream.
+"""
+
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_log = logging.getLogger('agbot.metrics')
+
+METRICS_TOKEN = os.environ.get('AGBOT_METRICS_TOKEN', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, count in items:
+            lines.append(f'{self.name}{_labels(self.label_names, values)} {count}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, values, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, values)} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, values)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value(s) read at scrape time from a callback returning {label value: number}."""
+
+    def __init__(self, name, help_text, label, callback):
+        self.name, self.help, self.label, self.callback = name, help_text, label, callback
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.callback()
+        except Exception as e:
+            _log.warning('Metrics gauge failed', extra={'metric': self.name, 'error': str(e)})
+            values = {}
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels((self.label,), (key,))} {value}')
+        return lines
+
+
+REQUESTS = Counter('agbot_http_requests_total', 'HTTP requests', ('method', 'endpoint', 'status'))
+REQUEST_LATENCY = Histogram('agbot_http_request_duration_seconds', 'HTTP request latency', ('endpoint',))
+DB_QUERIES = Histogram('agbot_db_queries_per_request', 'SQL statements executed per request', ('endpoint',),
+                       buckets=QUERY_BUCKETS)
+SCAN_STAGES = Histogram('agbot_scan_stage_seconds', 'Time spent in each scan pipeline stage', ('stage',),
+                        buckets=STAGE_BUCKETS)
+MODEL_CACHE = Counter('agbot_model_cache_total', 'Model singleton lookups', ('result',))
+
+_queue_sources = {}  # queue name -> callable returning its depth
+
+
+def register_queue(name, depth_fn):
+    """Report depth_fn() as agbot_queue_depth{queue=name} at each scrape."""
+    _queue_sources[name] = depth_fn
+
+
+def executor_depth(executor):
+    """Depth callback for a ThreadPoolExecutor (tasks submitted but not started)."""
+    return lambda: executor._work_queue.qsize()
+
+
+QUEUE_DEPTH = Gauge('agbot_queue_depth', 'Pending items in background queues', 'queue',
+                    lambda: {name: fn() for name, fn in _queue_sources.items()})
+
+_REGISTRY = [REQUESTS, REQUEST_LATENCY, DB_QUERIES, SCAN_STAGES, MODEL_CACHE, QUEUE_DEPTH]
+
+
+def register(metric):
+    """Add a metric defined elsewhere to the /metrics output."""
+    _REGISTRY.append(metric)
+    return metric
+
+
+@contextmanager
+def stage(name):
+    """Time a scan pipeline stage into agbot_scan_stage_seconds{stage=name}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SCAN_STAGES.observe(time.perf_counter() - started, name)
+
+
+def observe_stage(name, seconds):
+    SCAN_STAGES.observe(seconds, name)
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ─── Flask / SQLAlchemy wiring ──────────────────────────────────────────────────
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+
+
+def _endpoint_label():
+    # Route templates, not raw paths, so label cardinality stays bounded
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        endpoint = _endpoint_label()
+        REQUESTS.inc(request.method, endpoint, str(response.status_code))
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint)
+        DB_QUERIES.observe(g.pop('metrics_queries', 0), endpoint)
+    return response
+
+
+def metrics_view():
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode('latin-1'), METRICS_TOKEN.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Install request instrumentation, model/queue hooks and the /metrics route."""
+    import passwords
+    import storage
+    import weather
+    from model import set_instrumentation
+
+    set_instrumentation(stage=observe_stage,
+                        cache=lambda hit: MODEL_CACHE.inc('hit' if hit else 'miss'))
+    register_queue('derivatives', executor_depth(storage._derivative_executor))
+    register_queue('password_hashing', executor_depth(passwords._executor))
+    register_queue('weather', executor_depth(weather._executor))
+    register_queue('weather_inflight', lambda: len(weather._inflight))
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view, methods=['GET'])
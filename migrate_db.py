@@ -1,54 +1,40 @@
 """
-Database migration script to add new fields to User model
-Run this script once to add the new columns
+Database migration script.
+
+Applies pending schema migrations (see migrations.py) and records the
+schema version. Safe to run repeatedly. Equivalent to `flask --app app migrate`.
+
+    python migrate_db.py              # upgrade to the latest version
+    python migrate_db.py --status     # list migrations
+    python migrate_db.py --target 2   # stop after version 2
 """
+import argparse
+
 from app import app, db
-from sqlalchemy import text
+import migrations
 
-def migrate_database():
+def migrate_database(target=None):
     with app.app_context():
         try:
-            # Add new columns to users table
-            with db.engine.connect() as conn:
-                # Check if columns exist first to avoid errors
-                result = conn.execute(text("PRAGMA table_info(users)"))
-                existing_columns = [row[1] for row in result]
-
-                if 'theme' not in existing_columns:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN theme VARCHAR(20) DEFAULT 'emerald'"))
-                    conn.commit()
-                    print("✓ Added 'theme' column")
-
-                if 'farm_name' not in existing_columns:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN farm_name VARCHAR(100)"))
-                    conn.commit()
-                    print("✓ Added 'farm_name' column")
-
-                if 'farm_size' not in existing_columns:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN farm_size VARCHAR(50)"))
-                    conn.commit()
-                    print("✓ Added 'farm_size' column")
-
-                if 'crops' not in existing_columns:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN crops TEXT"))
-                    conn.commit()
-                    print("✓ Added 'crops' column")
-
-                if 'notification_email' not in existing_columns:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN notification_email BOOLEAN DEFAULT 1"))
-                    conn.commit()
-                    print("✓ Added 'notification_email' column")
-
-                if 'notification_push' not in existing_columns:
-                    conn.execute(text("ALTER TABLE users ADD COLUMN notification_push BOOLEAN DEFAULT 1"))
-                    conn.commit()
-                    print("✓ Added 'notification_push' column")
-
-            print("\n✅ Database migration completed successfully!")
-
+            db.create_all()
+            applied = migrations.upgrade(db.engine, target=target)
+            print(f"\n✅ Database at schema version {migrations.current_version(db.engine)} "
+                  f"({len(applied)} migration(s) applied)")
         except Exception as e:
             print(f"\n❌ Migration failed: {str(e)}")
             raise
 
+def show_status():
+    with app.app_context():
+        for version, name, applied in migrations.status(db.engine):
+            print(f"{'✓' if applied else ' '} {version:03d} {name}")
+
 if __name__ == '__main__':
-    migrate_database()
+    parser = argparse.ArgumentParser(description='Apply AGBOT database migrations')
+    parser.add_argument('--status', action='store_true', help='list migrations and exit')
+    parser.add_argument('--target', type=int, default=None, help='stop after this schema version')
+    args = parser.parse_args()
+    if args.status:
+        show_status()
+    else:
+        migrate_database(args.target)
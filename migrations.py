@@ -0,0 +1,302 @@
+"""
+migrations.py — Ordered, versioned schema migrations.
+
+Each migration is a function registered with @migration(version, name).
+Applied versions are recorded in the schema_migrations table, so
+upgrade() only runs what is missing, in order. Every migration is also
+written to be idempotent (helpers check before they change anything),
+so a database created by db.create_all() at the latest schema simply
+gets stamped.
+
+Helpers for changes that must not stall a live app:
+
+- create_index(): online where the backend supports it (PostgreSQL
+  CONCURRENTLY, MySQL LOCK=NONE). SQLite has no online build, but in WAL
+  mode (see db_config.py) readers keep working while it runs.
+- backfill(): updates a table in primary-key batches. Each batch is its
+  own short transaction, with a pause between batches, so writers are
+  never locked out for long.
+
+Run with `flask --app app migrate` (or `python migrate_db.py`). app.py
+also upgrades on startup unless AGBOT_AUTO_MIGRATE=0.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+AUTO_MIGRATE = os.environ.get('AGBOT_AUTO_MIGRATE', '1') != '0'
+BACKFILL_BATCH_SIZE = int(os.environ.get('AGBOT_BACKFILL_BATCH_SIZE', 1000))
+BACKFILL_PAUSE = float(os.environ.get('AGBOT_BACKFILL_PAUSE', 0.05))  # seconds between batches
+
+VERSION_TABLE = 'schema_migrations'
+
+MIGRATIONS = []  # (version, name, fn), kept sorted by version
+
+
+def migration(version, name):
+    """Register fn(m) as schema migration `version`. fn gets a Migrator."""
+    def register(fn):
+        if any(v == version for v, _, _ in MIGRATIONS):
+            raise ValueError(f'Duplicate migration version {version}')
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+class Migrator:
+    """Idempotent schema helpers bound to one engine."""
+
+    def __init__(self, engine, log=print):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.log = log
+
+    def has_table(self, table):
+        return inspect(self.engine).has_table(table)
+
+    def columns(self, table):
+        return {col['name'] for col in inspect(self.engine).get_columns(table)}
+
+    def indexes(self, table):
+        return {ix['name'] for ix in inspect(self.engine).get_indexes(table)}
+
+    def execute(self, sql, **params):
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), params)
+
+    def add_column(self, table, name, ddl):
+        """ALTER TABLE ... ADD COLUMN unless it already exists. Returns True if added."""
+        if name in self.columns(table):
+            return False
+        self.execute(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}')
+        self.log(f"  + {table}.{name}")
+        return True
+
+    def create_table(self, model):
+        """Create a model's table (and its indexes) if missing."""
+        if not self.has_table(model.__tablename__):
+            model.__table__.create(self.engine)
+            self.log(f"  + table {model.__tablename__}")
+
+    def create_index(self, name, table, columns, unique=False):
+        """Create an index without blocking writes where the backend allows it."""
+        if name in self.indexes(table):
+            return False
+        unique_sql = 'UNIQUE ' if unique else ''
+        cols = ', '.join(columns)
+        if self.dialect == 'postgresql':
+            # CONCURRENTLY can't run inside a transaction block
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f'CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})'))
+        elif self.dialect == 'mysql':
+            self.execute(f'CREATE {unique_sql}INDEX {name} ON {table} ({cols}) ALGORITHM=INPLACE LOCK=NONE')
+        else:
+            self.execute(f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({cols})')
+        self.log(f"  + index {name} on {table} ({cols})")
+        return True
+
+    def backfill(self, table, set_sql, where_sql='1=1', key='id',
+                 batch_size=None, pause=None, **params):
+        """UPDATE table SET <set_sql> WHERE <where_sql>, one key range per transaction.
+
+        Returns the number of rows updated.
+        """
+        batch_size = batch_size or BACKFILL_BATCH_SIZE
+        pause = BACKFILL_PAUSE if pause is None else pause
+        with self.engine.connect() as conn:
+            lo, hi = conn.execute(text(f'SELECT MIN({key}), MAX({key}) FROM {table}')).one()
+        if lo is None:
+            return 0
+
+        updated = 0
+        start = lo
+        while start <= hi:
+            end = start + batch_size
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    text(f'UPDATE {table} SET {set_sql} '
+                         f'WHERE {key} >= :_lo AND {key} < :_hi AND ({where_sql})'),
+                    {'_lo': start, '_hi': end, **params})
+                updated += result.rowcount or 0
+            start = end
+            if pause and start <= hi:
+                time.sleep(pause)
+        if updated:
+            self.log(f"  ~ backfilled {updated} row(s) in {table}")
+        return updated
+
+
+# ─── Version bookkeeping ────────────────────────────────────────────────────────
+
+def _ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ('
+            'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'))
+
+
+def applied_versions(engine):
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f'SELECT version FROM {VERSION_TABLE}'))}
+
+
+def current_version(engine):
+    return max(applied_versions(engine), default=0)
+
+
+@contextmanager
+def _migration_lock(engine):
+    """Serialize concurrent upgrades (several workers starting at once).
+
+    PostgreSQL gets an advisory lock. Elsewhere migrations are idempotent and
+    the version insert is keyed, so a race just repeats no-op checks.
+    """
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text('SELECT pg_advisory_lock(724133)'))
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(724133)'))
+
+
+def pending(engine, target=None):
+    done = applied_versions(engine)
+    return [(v, name, fn) for v, name, fn in MIGRATIONS
+            if v not in done and (target is None or v <= target)]
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending migrations in order. Returns the list of versions applied."""
+    applied = []
+    with _migration_lock(engine):
+        migrator = Migrator(engine, log)
+        for version, name, fn in pending(engine, target):
+            log(f"Applying migration {version:03d} {name}")
+            started = time.monotonic()
+            fn(migrator)
+            with engine.begin() as conn:
+                if conn.execute(text(f'SELECT 1 FROM {VERSION_TABLE} WHERE version = :v'),
+                                {'v': version}).first() is None:
+                    conn.execute(text(f'INSERT INTO {VERSION_TABLE} (version, name, applied_at) '
+                                      'VALUES (:v, :n, :t)'),
+                                 {'v': version, 'n': name, 't': datetime.utcnow()})
+            log(f"  done in {time.monotonic() - started:.2f}s")
+            applied.append(version)
+    return applied
+
+
+def status(engine):
+    """[(version, name, applied?)] for every known migration."""
+    done = applied_versions(engine)
+    return [(v, name, v in done) for v, name, _ in MIGRATIONS]
+
+
+def upgrade_on_startup(app, db):
+    """Create missing tables and apply pending migrations (unless AGBOT_AUTO_MIGRATE=0)."""
+    with app.app_context():
+        db.create_all()
+        if AUTO_MIGRATE:
+            upgrade(db.engine)
+
+
+# ─── Migrations ─────────────────────────────────────────────────────────────────
+# Append new migrations at the end with the next version number. Never edit
+# or renumber one that has shipped.
+
+@migration(1, 'user_profile_columns')
+def _user_profile_columns(m):
+    m.add_column('users', 'theme', "VARCHAR(20) DEFAULT 'emerald'")
+    m.add_column('users', 'farm_name', 'VARCHAR(100)')
+    m.add_column('users', 'farm_size', 'VARCHAR(50)')
+    m.add_column('users', 'crops', 'TEXT')
+    m.add_column('users', 'notification_email', 'BOOLEAN DEFAULT TRUE')
+    m.add_column('users', 'notification_push', 'BOOLEAN DEFAULT TRUE')
+
+
+@migration(2, 'sync_updated_at')
+def _sync_updated_at(m):
+    for table in ('scans', 'feedbacks'):
+        m.add_column(table, 'updated_at', 'TIMESTAMP')
+        m.backfill(table, 'updated_at = created_at', 'updated_at IS NULL')
+        m.create_index(f'ix_{table}_updated_at', table, ['updated_at'])
+
+
+@migration(3, 'sync_tables')
+def _sync_tables(m):
+    from models import Tombstone, SyncOperation
+    m.create_table(Tombstone)
+    m.create_table(SyncOperation)
+
+
+@migration(4, 'scan_archive')
+def _scan_archive(m):
+    from models import ArchivedScan, ScanMonthlyStat
+    m.create_table(ArchivedScan)
+    m.create_table(ScanMonthlyStat)
+
+
+@migration(5, 'confusion_matrix')
+def _confusion_matrix(m):
+    import analytics
+    from models import ConfusionCell
+    m.create_table(ConfusionCell)
+    with m.engine.begin() as conn:
+        cells = analytics.rebuild(conn)
+    m.log(f"  ~ {cells} confusion cell(s) from existing feedback")
+
+
+@migration(6, 'scans_autoincrement')
+def _scans_autoincrement(m):
+    # A plain INTEGER PRIMARY KEY lets SQLite hand out the id of a deleted
+    # newest scan again, which can collide with that scan's copy in
+    # scans_archive. AUTOINCREMENT never reuses ids. Other backends use
+    # sequences, which never reuse ids either.
+    if m.dialect != 'sqlite':
+        return
+    from sqlalchemy.schema import CreateTable
+    from models import Scan
+
+    with m.engine.connect() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'scans'")).scalar()
+    if ddl is None or 'AUTOINCREMENT' in ddl.upper():
+        return
+
+    table = Scan.__table__
+    create = str(CreateTable(table).compile(dialect=m.engine.dialect)).strip()
+    create = create.replace('CREATE TABLE scans ', 'CREATE TABLE scans_rebuild ', 1)
+    columns = ', '.join(c.name for c in table.columns if c.name in m.columns('scans'))
+    # One transaction: the table is rewritten, so writers wait for its length
+    with m.engine.begin() as conn:
+        conn.execute(text(create))
+        conn.execute(text(f'INSERT INTO scans_rebuild ({columns}) SELECT {columns} FROM scans'))
+        conn.execute(text('DROP TABLE scans'))
+        conn.execute(text('ALTER TABLE scans_rebuild RENAME TO scans'))
+        for index in table.indexes:
+            index.create(conn)
+        top = conn.execute(text('SELECT MAX(id) FROM (SELECT id FROM scans UNION ALL '
+                                'SELECT id FROM scans_archive)')).scalar() or 0
+        # Hot scans that already got an archived scan's id move to fresh ids
+        clashes = [row[0] for row in conn.execute(text('SELECT id FROM scans WHERE id IN '
+                                                       '(SELECT id FROM scans_archive) ORDER BY id'))]
+        for old in clashes:
+            top += 1
+            params = {'old': old, 'new': top, 'now': datetime.utcnow()}
+            conn.execute(text('UPDATE scans SET id = :new, updated_at = :now WHERE id = :old'), params)
+            conn.execute(text('UPDATE feedbacks SET scan_id = :new WHERE scan_id = :old'), params)
+            conn.execute(text("UPDATE sync_operations SET result_id = :new "
+                              "WHERE kind = 'scan' AND result_id = :old"), params)
+        # Start new ids above every id already used, hot or archived
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'scans'"))
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('scans', :seq)"), {'seq': top})
+    m.log(f"  ~ rebuilt scans with AUTOINCREMENT (next id > {top})")
+    if clashes:
+        m.log(f"  ~ renumbered {len(clashes)} hot scan(s) whose id was already archived")
@@ -0,0 +1,292 @@
+"""
+benchmark.py — Reproducible inference benchmark for PlantPestModel.
+
+Runs the model over a fixed image set and writes the results as JSON:
+  - model load time and peak RSS
+  - per-stage latency of predict(): image decode, _transform, forward and
+    post-process (top-k, class mapping, decision), as mean/p50/p95
+  - forward throughput (images/s) for each batch size x torch thread count
+
+The image set is either synthetic (seeded, so every run sees the same
+bytes) or the first --limit images of a folder such as dataset/val.
+With --baseline, results are compared against an earlier run's JSON.
+Anything more than --tolerance worse is reported as a regression and
+the exit status is 1, so it can gate CI.
+
+Usage:
+    python3 ml_model/benchmark.py --output bench.json
+    python3 ml_model/benchmark.py --images dataset/val --limit 200
+    python3 ml_model/benchmark.py --baseline bench.json --tolerance 0.15
+    python3 ml_model/benchmark.py --random-weights   # no agbot_model.pth needed
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import model as model_module
+from model import PlantPestModel
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+
+SEED = 1234
+SYNTHETIC_COUNT = 32
+SYNTHETIC_SIZES = [(1024, 768), (2048, 1536), (768, 1024), (640, 640)]  # typical phone uploads
+WARMUP = 3
+BATCH_SIZES = [1, 4, 8, 16]
+BATCH_ITERATIONS = 10
+TOLERANCE = 0.10  # 10% worse than baseline counts as a regression
+
+STAGES = ['image_decode', 'transform', 'forward', 'post_process', 'total']
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+# ─── Image sets ──────────────────────────────────────────────────────────────
+
+def synthetic_images(count=SYNTHETIC_COUNT, seed=SEED):
+    """Deterministic JPEGs: smooth random colour fields at phone-photo sizes."""
+    generator = torch.Generator().manual_seed(seed)
+    to_pil = transforms.ToPILImage()
+    images = []
+    for i in range(count):
+        width, height = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        coarse = torch.rand(3, height // 32, width // 32, generator=generator)
+        image = to_pil(coarse).resize((width, height), Image.BICUBIC)
+        buf = io.BytesIO()
+        image.save(buf, 'JPEG', quality=90)
+        images.append(buf.getvalue())
+    return images
+
+
+def folder_images(folder, limit):
+    paths = sorted(p for p in Path(folder).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)[:limit]
+    if not paths:
+        raise SystemExit(f"No images found under {folder}")
+    return [p.read_bytes() for p in paths]
+
+
+# ─── Measurements ────────────────────────────────────────────────────────────
+
+def write_random_checkpoint(path):
+    """A checkpoint with the real class list and seeded random weights."""
+    with open(Path(__file__).parent / 'training_log.json') as f:
+        classes = json.load(f)['classes']
+    torch.manual_seed(SEED)
+    network = model_module._build_network(len(classes))
+    torch.save({
+        'classes': classes,
+        'class_to_idx': {name: i for i, name in enumerate(sorted(classes))},  # ImageFolder order
+        'num_classes': len(classes),
+        'best_acc': 0,
+        'model_state_dict': network.state_dict(),
+    }, path)
+
+
+def load_model(random_weights):
+    if not random_weights:
+        started = time.perf_counter()
+        model = PlantPestModel()
+        return model, time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'random.pth')
+        write_random_checkpoint(path)
+        started = time.perf_counter()
+        model = PlantPestModel(model_path=path)
+        return model, time.perf_counter() - started
+
+
+def _summary(values):
+    ordered = sorted(values)
+    return {
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+
+def bench_stages(model, images, repeats):
+    """Time each predict() stage using the model's instrumentation hook."""
+    timings = {name: [] for name in STAGES}
+    current = {}
+    model_module.set_instrumentation(stage=lambda name, seconds: current.__setitem__(name, seconds))
+    try:
+        for image in images[:WARMUP]:
+            model.predict(image)
+        for _ in range(repeats):
+            for image in images:
+                current.clear()
+                started = time.perf_counter()
+                model.predict(image)
+                total = time.perf_counter() - started
+                for name in ('image_decode', 'transform', 'forward'):
+                    timings[name].append(current.get(name, 0.0))
+                timings['post_process'].append(max(0.0, total - sum(current.values())))
+                timings['total'].append(total)
+    finally:
+        model_module.set_instrumentation()
+    return {name: _summary(values) for name, values in timings.items()}
+
+
+@torch.no_grad()
+def bench_throughput(model, images, batch_sizes, thread_counts, iterations):
+    """Forward-pass images/s for each thread count and batch size."""
+    tensors = [model.preprocess(image) for image in images]
+    original_threads = torch.get_num_threads()
+    results = []
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for batch_size in batch_sizes:
+                batch = torch.cat([tensors[i % len(tensors)] for i in range(batch_size)])
+                model.model(batch)  # warm-up
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    model.model(batch)
+                elapsed = time.perf_counter() - started
+                results.append({
+                    'threads': threads,
+                    'batch_size': batch_size,
+                    'images_per_s': round(batch_size * iterations / elapsed, 2),
+                    'batch_ms': round(elapsed / iterations * 1000, 3),
+                })
+    finally:
+        torch.set_num_threads(original_threads)
+    return results
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def environment(model):
+    return {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'device': str(model.device),
+        'trained_model': model.using_trained_model,
+    }
+
+
+# ─── Baseline comparison ─────────────────────────────────────────────────────
+
+def _throughput_key(entry):
+    return f"throughput[threads={entry['threads']},batch={entry['batch_size']}]"
+
+
+def _flatten(results):
+    """metric name -> (value, higher_is_better)"""
+    flat = {'load_time_s': (results['load_time_s'], False)}
+    if results.get('peak_rss_mb') is not None:
+        flat['peak_rss_mb'] = (results['peak_rss_mb'], False)
+    for name, summary in results['stages'].items():
+        flat[f'{name}.p50_ms'] = (summary['p50_ms'], False)
+        flat[f'{name}.p95_ms'] = (summary['p95_ms'], False)
+    for entry in results['throughput']:
+        flat[_throughput_key(entry)] = (entry['images_per_s'], True)
+    return flat
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """List of metrics that are more than `tolerance` worse than the baseline."""
+    now, before = _flatten(current), _flatten(baseline)
+    regressions = []
+    for name, (value, higher_is_better) in now.items():
+        if name not in before or not before[name][0]:
+            continue
+        old = before[name][0]
+        change = (value - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({'metric': name, 'baseline': old, 'current': value,
+                                'change_pct': round(change * 100, 1)})
+    return regressions
+
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--images', help='folder of images to use instead of the synthetic set')
+    parser.add_argument('--limit', type=int, default=SYNTHETIC_COUNT, help='number of images')
+    parser.add_argument('--repeats', type=int, default=3, help='passes over the image set for stage timings')
+    parser.add_argument('--batch-sizes', type=_int_list, default=BATCH_SIZES)
+    parser.add_argument('--threads', type=_int_list, default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument('--iterations', type=int, default=BATCH_ITERATIONS, help='batches per throughput run')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='benchmark the fine-tuned architecture with seeded random weights')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='compare against this results JSON; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    torch.manual_seed(SEED)
+    images = folder_images(args.images, args.limit) if args.images else synthetic_images(args.limit)
+
+    model, load_time = load_model(args.random_weights)
+    results = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(model),
+        'image_set': {'source': args.images or f'synthetic(seed={SEED})', 'count': len(images)},
+        'load_time_s': round(load_time, 3),
+        'torch_threads': torch.get_num_threads(),
+        'stages': bench_stages(model, images, args.repeats),
+        'throughput': bench_throughput(model, images, args.batch_sizes, args.threads, args.iterations),
+    }
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    env = results['environment']
+    print(f"Device {env['device']} | torch {env['torch']} | {len(images)} images | "
+          f"load {results['load_time_s']:.2f}s | peak RSS {results['peak_rss_mb']} MB\n")
+    print(f"{'stage':<14}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, s in results['stages'].items():
+        print(f"{name:<14}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}")
+    print(f"\n{'threads':<9}{'batch':>6}{'images/s':>11}{'batch ms':>11}")
+    for t in results['throughput']:
+        print(f"{t['threads']:<9}{t['batch_size']:>6}{t['images_per_s']:>11.1f}{t['batch_ms']:>11.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment', {}).get('device') != env['device']:
+            print(f"\nWarning: baseline ran on {baseline.get('environment', {}).get('device')}, this run on {env['device']}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for r in regressions:
+                print(f"  {r['metric']:<40} {r['baseline']} -> {r['current']} ({r['change_pct']:+.1f}%)")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,39 +6,90 @@ Achieves 88.3% validation accuracy.
 
 Falls back to the old ImageNet mapping approach if the trained model
 file (agbot_model.pth) is not found.
+
+torch and torchvision are imported on first use, not at module import,
+so the web app, migrate_db.py and CLI commands start without paying for
+them. Only building the model (get_model) and inference load torch.
 """
 
-import ssl
 import os
 import json
-import torch
-import torch.nn as nn
-from torchvision import transforms, models
+import logging
+import threading
+import time
 from PIL import Image
 import io
 
-# Fix macOS SSL certificate issue
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
 _MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
 _PEST_DATA_PATH = os.path.join(_MODEL_DIR, "pest_data.json")
-_TRAINED_MODEL_PATH = os.path.join(_MODEL_DIR, "agbot_model.pth")
+_TRAINED_MODEL_PATH = os.environ.get("AGBOT_MODEL_PATH") or os.path.join(_MODEL_DIR, "agbot_model.pth")
+
+_transform = None
+
+
+_log = logging.getLogger('agbot.model')
+# Per-scan diagnostics; sampled and rate-limited when logging_config is active
+_prediction_log = logging.getLogger('agbot.model.predictions')
+
+# Optional instrumentation, installed by the web app (see metrics.py):
+#   _stage_hook(name, seconds)  — time spent in a pipeline stage
+#   _cache_hook(hit)            — get_model() found (True) or built (False) the model
+_stage_hook = None
+_cache_hook = None
+
+
+def set_instrumentation(stage=None, cache=None):
+    global _stage_hook, _cache_hook
+    _stage_hook, _cache_hook = stage, cache
+
+
+def _record(name, started):
+    if _stage_hook is not None:
+        _stage_hook(name, time.perf_counter() - started)
+
+
+def _log_prediction(results, decision, gap=None):
+    """Top-5 and the decision as one structured record (replaces the stdout table)."""
+    if _prediction_log.isEnabledFor(logging.INFO):
+        _prediction_log.info('prediction', extra={
+            'top5': [{'class': r['raw_class'], 'confidence': r['confidence']} for r in results[:5]],
+            'decision': decision,
+            'gap': round(gap, 1) if gap is not None else None,
+        })
+
+
+def _get_transform():
+    """Image preprocessing pipeline (built on first use)."""
+    global _transform
+    if _transform is None:
+        from torchvision import transforms
+        _transform = transforms.Compose([
+            transforms.Resize(256),
+            transforms.CenterCrop(224),
+            transforms.ToTensor(),
+            transforms.Normalize(
+                mean=[0.485, 0.456, 0.406],
+                std=[0.229, 0.224, 0.225],
+            ),
+        ])
+    return _transform
 
-# Image preprocessing
-_transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225],
-    ),
-])
+
+def _build_network(num_classes):
+    """EfficientNetB0 with the fine-tuned classifier head (untrained weights)."""
+    import torch.nn as nn
+    from torchvision import models
+
+    model = models.efficientnet_b0(weights=None)
+    in_features = model.classifier[1].in_features
+    model.classifier = nn.Sequential(
+        nn.Dropout(p=0.3),
+        nn.Linear(in_features, 256),
+        nn.ReLU(),
+        nn.Dropout(p=0.2),
+        nn.Linear(256, num_classes),
+    )
+    return model
 
 
 def _load_pest_data():
@@ -50,7 +101,10 @@ def _load_pest_data():
 class PlantPestModel:
     """Fine-tuned EfficientNetB0 for plant pest detection (18 classes, 88.3% accuracy)."""
 
-    def __init__(self):
+    def __init__(self, model_path=None):
+        import torch
+
+        self.model_path = model_path or _TRAINED_MODEL_PATH
         self.device = torch.device(
             "cuda" if torch.cuda.is_available()
             else "mps" if torch.backends.mps.is_available()
@@ -60,32 +114,24 @@ class PlantPestModel:
         self.pest_db = _load_pest_data()["pests"]
         self.using_trained_model = False
 
-        if os.path.exists(_TRAINED_MODEL_PATH):
+        if os.path.exists(self.model_path):
             self._load_trained_model()
         else:
             self._load_imagenet_fallback()
 
     def _load_trained_model(self):
         """Load the fine-tuned model."""
-        print("Loading fine-tuned AGBOT model...")
-        checkpoint = torch.load(_TRAINED_MODEL_PATH, map_location=self.device, weights_only=False)
+        import torch
+
+        _log.info("Loading fine-tuned AGBOT model")
+        checkpoint = torch.load(self.model_path, map_location=self.device, weights_only=False)
 
         self.classes = checkpoint['classes']
         self.class_to_idx = checkpoint.get('class_to_idx', {})
         num_classes = checkpoint['num_classes']
         best_acc = checkpoint.get('best_acc', 0)
 
-        # Rebuild model architecture
-        model = models.efficientnet_b0(weights=None)
-        in_features = model.classifier[1].in_features
-        model.classifier = nn.Sequential(
-            nn.Dropout(p=0.3),
-            nn.Linear(in_features, 256),
-            nn.ReLU(),
-            nn.Dropout(p=0.2),
-            nn.Linear(256, num_classes),
-        )
-
+        model = _build_network(num_classes)
         model.load_state_dict(checkpoint['model_state_dict'])
         model.to(self.device)
         model.eval()
@@ -97,50 +143,58 @@ class PlantPestModel:
         for k, v in self.class_to_idx.items():
             self.idx_to_class[v] = k
 
-        print(f"  Fine-tuned model loaded on {self.device}")
-        print(f"  Classes: {num_classes} | Best accuracy: {best_acc:.1f}%")
+        _log.info("Fine-tuned model loaded", extra={
+            'device': str(self.device), 'num_classes': num_classes, 'best_acc': round(best_acc, 1)})
 
     def _load_imagenet_fallback(self):
         """Fallback: use pre-trained ImageNet model with manual mapping."""
-        print("WARNING: Trained model not found, using ImageNet fallback (lower accuracy)")
+        import ssl
+        from torchvision import models
+
+        _log.warning("Trained model not found, using ImageNet fallback (lower accuracy)")
+        # Fix macOS SSL certificate issue when downloading the ImageNet weights
+        ssl._create_default_https_context = ssl._create_unverified_context
         weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1
         self.model = models.efficientnet_b0(weights=weights)
         self.model.to(self.device)
         self.model.eval()
         self.classes = [p["name"] for p in self.pest_db]
         self.using_trained_model = False
-        print(f"  ImageNet fallback loaded on {self.device}")
+        _log.info("ImageNet fallback loaded", extra={'device': str(self.device)})
 
     def preprocess(self, image_bytes):
         """Convert raw image bytes to a model-ready tensor."""
+        started = time.perf_counter()
         image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        tensor = _transform(image).unsqueeze(0)
-        return tensor.to(self.device)
+        _record('image_decode', started)
+        started = time.perf_counter()
+        tensor = _get_transform()(image).unsqueeze(0).to(self.device)
+        _record('transform', started)
+        return tensor
 
-    @torch.no_grad()
     def predict(self, image_bytes, top_k=3):
         """Run inference and return top-k predictions."""
-        if self.using_trained_model:
-            return self._predict_trained(image_bytes, top_k)
-        else:
-            return self._predict_fallback(image_bytes, top_k)
+        import torch
+
+        with torch.no_grad():
+            if self.using_trained_model:
+                return self._predict_trained(image_bytes, top_k)
+            else:
+                return self._predict_fallback(image_bytes, top_k)
 
     def _predict_trained(self, image_bytes, top_k):
         """Predict using the fine-tuned model."""
+        import torch
+
         tensor = self.preprocess(image_bytes)
+        started = time.perf_counter()
         logits = self.model(tensor)
         probs = torch.softmax(logits, dim=1).squeeze(0)
+        _record('forward', started)
 
         # Always get top 5 for diagnostics and "Other Possibilities"
         top_probs, top_indices = torch.topk(probs, k=min(max(top_k, 5), len(self.classes)))
 
-        # Print diagnostics to console
-        print("\n--- AGBOT Prediction (Fine-tuned) ---")
-        for p, idx in zip(top_probs[:5], top_indices[:5]):
-            name = self.idx_to_class.get(idx.item(), '?')
-            print(f"  {name:<25s} {p.item()*100:.1f}%")
-        print("-------------------------------------\n")
-
         results = []
         for prob, idx in zip(top_probs, top_indices):
             class_name = self.idx_to_class.get(idx.item(), "Unknown")
@@ -161,6 +215,7 @@ class PlantPestModel:
 
         # If the model's actual top prediction is "Healthy"
         if results[0]["class_name"] == "Healthy":
+            _log_prediction(results, 'healthy')
             return [{
                 "class_index": -1,
                 "class_name": "Healthy",
@@ -180,15 +235,14 @@ class PlantPestModel:
         second_pest_conf = pest_results[1]["confidence"] if len(pest_results) > 1 else 0
         gap = first_pest_conf - second_pest_conf
 
-        print(f"  Decision: top={pest_results[0]['class_name']} {first_pest_conf}%, "
-              f"2nd={pest_results[1]['class_name'] if len(pest_results)>1 else '?'} {second_pest_conf}%, "
-              f"gap={gap:.1f}%")
-
         # If the top pest has reasonable confidence, trust it.
         # Only reject if confidence is very low (under 20%)
         if first_pest_conf >= 20:
+            _log_prediction(results, 'pest', gap)
             return pest_results[:top_k]
 
+        _log_prediction(results, 'low_confidence', gap)
+
         # Very low confidence = no clear pest
         return [{
             "class_index": -1,
@@ -199,6 +253,8 @@ class PlantPestModel:
 
     def _predict_fallback(self, image_bytes, top_k):
         """Fallback: ImageNet mapping approach (old method)."""
+        import torch
+
         IMAGENET_TO_PEST = {
             75: "Spider Mites", 78: "Spider Mites", 77: "Spider Mites", 79: "Spider Mites",
             72: "Mealybugs", 113: "Scale Insects", 114: "Scale Insects",
@@ -214,8 +270,10 @@ class PlantPestModel:
         }
 
         tensor = self.preprocess(image_bytes)
+        started = time.perf_counter()
         logits = self.model(tensor)
         probs = torch.softmax(logits, dim=1).squeeze(0)
+        _record('forward', started)
         top_probs, top_indices = torch.topk(probs, k=25)
 
         pest_scores = {}
@@ -241,9 +299,17 @@ class PlantPestModel:
 
 # Singleton
 _model_instance = None
+_model_lock = threading.Lock()
 
 def get_model():
     global _model_instance
-    if _model_instance is None:
-        _model_instance = PlantPestModel()
+    hit = _model_instance is not None
+    if not hit:
+        # The warm-up thread and a first request can race; load only once
+        with _model_lock:
+            hit = _model_instance is not None
+            if not hit:
+                _model_instance = PlantPestModel()
+    if _cache_hook is not None:
+        _cache_hook(hit)
     return _model_instance
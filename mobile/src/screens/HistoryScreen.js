@@ -123,7 +123,7 @@ function ExpandableItem({ item, theme }) {
           {/* Scan image */}
           {item.image_path && (
             <Image
-              source={{ uri: api.getImageUrl(item.image_path) }}
+              source={{ uri: api.getImageUrl(item.image_path, 'medium') }}
               style={{ width: '100%', height: 160, borderRadius: 10, marginBottom: 12, backgroundColor: theme.border }}
               resizeMode="cover"
             />
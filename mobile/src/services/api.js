@@ -50,6 +50,7 @@ class ApiService {
   }
 
   async getHistory() { return await this.request('/api/history'); }
+  async sync(since, ops = []) { return await this.request('/api/sync', { method: 'POST', body: JSON.stringify({ since, ops }) }); }
   async updateProfile(d) { return await this.request('/api/profile', { method: 'PUT', body: JSON.stringify(d) }); }
   async updatePreferences(d) { return await this.request('/api/preferences', { method: 'PUT', body: JSON.stringify(d) }); }
   async changePassword(cur, nw, conf) { return await this.request('/api/security', { method: 'PUT', body: JSON.stringify({ current_password: cur, new_password: nw, confirm_password: conf }) }); }
@@ -61,7 +62,7 @@ class ApiService {
   async exportProfile() { return await this.request('/api/export/profile'); }
   async chat(message) { return await this.request('/api/chat', { method: 'POST', body: JSON.stringify({ message }) }); }
   async getPestLibrary() { return await this.request('/api/pest_library'); }
-  getImageUrl(imagePath) { return imagePath ? `${BASE_URL}/api/uploads/${imagePath}` : null; }
+  getImageUrl(imagePath, size) { return imagePath ? `${BASE_URL}/api/uploads/${imagePath}${size ? `?size=${size}` : ''}` : null; }
 }
 
 export default new ApiService();
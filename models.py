@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+import passwords
 from datetime import datetime
+from sqlalchemy import event
 
 db = SQLAlchemy()
 
@@ -36,12 +37,24 @@ class User(UserMixin, db.Model):
     feedbacks = db.relationship('Feedback', backref='user', lazy='dynamic', cascade='all, delete-orphan')
 
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (runs on the bounded hashing pool)"""
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        """Verify password"""
-        return check_password_hash(self.password_hash, password)
+        """Verify password, upgrading the stored hash if the hash settings changed.
+
+        The caller commits; a rehash is just another pending column change.
+        The rehash is best-effort: if the hashing pool is busy, the old hash
+        stays until the next login rather than failing a valid one.
+        """
+        if not passwords.verify_password(self.password_hash, password):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            try:
+                self.set_password(password)
+            except passwords.HashingBusy:
+                pass
+        return True
 
     def to_dict(self):
         """Convert user to dictionary"""
@@ -59,6 +72,8 @@ class User(UserMixin, db.Model):
 class Scan(db.Model):
     """Scan history model"""
     __tablename__ = 'scans'
+    # Never reuse a deleted scan's id: scans_archive keeps archived scans' ids
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -72,15 +87,27 @@ class Scan(db.Model):
     field_name = db.Column(db.String(100), nullable=True)
     damage_pattern = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # Relationships
     feedbacks = db.relationship('Feedback', backref='scan', lazy='dynamic', cascade='all, delete-orphan')
 
-    def to_dict(self):
-        """Convert scan to dictionary"""
+    def to_dict(self, has_feedback=None):
+        """Convert scan to dictionary
+
+        Pass has_feedback when rendering many scans (see api._feedback_counts)
+        to skip the per-scan feedback COUNT.
+        """
+        if has_feedback is None:
+            has_feedback = self.feedbacks.count() > 0
         return {
             'id': self.id,
             'image_path': self.image_path,
+            'image_urls': {
+                'original': f'/api/uploads/{self.image_path}',
+                'thumb': f'/api/uploads/{self.image_path}?size=thumb',
+                'medium': f'/api/uploads/{self.image_path}?size=medium',
+            } if self.image_path else None,
             'pest_identified': self.pest_identified,
             'pest_scientific': self.pest_scientific,
             'confidence': self.confidence,
@@ -90,7 +117,8 @@ class Scan(db.Model):
             'crop_type': self.crop_type,
             'field_name': self.field_name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'has_feedback': self.feedbacks.count() > 0
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'has_feedback': has_feedback
         }
 
 
@@ -116,15 +144,18 @@ class Feedback(db.Model):
     helpful = db.Column(db.Boolean, nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     def to_dict(self):
         """Convert feedback to dictionary"""
         return {
             'id': self.id,
+            'scan_id': self.scan_id,
             'is_correct': self.is_correct,
             'actual_pest_name': self.actual_pest_name,
             'notes': self.notes,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
@@ -154,3 +185,129 @@ class PestDatabase(db.Model):
             'scientific_name': self.scientific_name,
             'category': self.category
         }
+
+
+class Tombstone(db.Model):
+    """Record of a deleted scan/feedback so sync clients can drop their copy"""
+    __tablename__ = 'tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    entity = db.Column(db.String(20), nullable=False)  # scan, feedback
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def to_dict(self):
+        return {
+            'entity': self.entity,
+            'id': self.entity_id,
+            'deleted_at': self.deleted_at.isoformat()
+        }
+
+
+class SyncOperation(db.Model):
+    """Idempotency record for an offline operation uploaded through /api/sync"""
+    __tablename__ = 'sync_operations'
+    __table_args__ = (db.UniqueConstraint('user_id', 'idempotency_key', name='uq_sync_operation_key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # scan, feedback
+    result_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ArchivedScan(db.Model):
+    """Scan moved out of the hot scans table by retention.py (same id as the original; scans ids are never reused)"""
+    __tablename__ = 'scans_archive'
+    __table_args__ = (db.Index('ix_scans_archive_user_created', 'user_id', 'created_at'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    image_path = db.Column(db.String(255), nullable=True)
+    pest_identified = db.Column(db.String(100), nullable=True)
+    pest_scientific = db.Column(db.String(100), nullable=True)
+    confidence = db.Column(db.Float, nullable=True)
+    status = db.Column(db.String(50), nullable=True)
+    severity = db.Column(db.String(50), nullable=True)
+    crop_type = db.Column(db.String(100), nullable=True)
+    field_name = db.Column(db.String(100), nullable=True)
+    damage_pattern = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    feedback_count = db.Column(db.Integer, default=0)
+    feedback_json = db.Column(db.Text, nullable=True)  # JSON list of the scan's Feedback.to_dict()
+
+    def to_dict(self):
+        """Same shape as Scan.to_dict(), flagged as archived"""
+        return {
+            'id': self.id,
+            'image_path': self.image_path,
+            'image_urls': {
+                'original': f'/api/uploads/{self.image_path}',
+                'thumb': f'/api/uploads/{self.image_path}?size=thumb',
+                'medium': f'/api/uploads/{self.image_path}?size=medium',
+            } if self.image_path else None,
+            'pest_identified': self.pest_identified,
+            'pest_scientific': self.pest_scientific,
+            'confidence': self.confidence,
+            'status': self.status,
+            'severity': self.severity,
+            'damage_pattern': self.damage_pattern,
+            'crop_type': self.crop_type,
+            'field_name': self.field_name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'has_feedback': (self.feedback_count or 0) > 0,
+            'archived': True
+        }
+
+
+class ScanMonthlyStat(db.Model):
+    """Per-user monthly totals for archived scans, so dashboards keep their history"""
+    __tablename__ = 'scan_monthly_stats'
+    __table_args__ = (db.UniqueConstraint('user_id', 'month', name='uq_scan_monthly_stat'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    total = db.Column(db.Integer, default=0, nullable=False)
+    confidence_sum = db.Column(db.Float, default=0, nullable=False)
+    severity_counts = db.Column(db.Text, nullable=True)  # JSON {severity: count}
+    pest_counts = db.Column(db.Text, nullable=True)  # JSON {pest name: count}
+
+
+class ConfusionCell(db.Model):
+    """Feedback count for one (predicted, actual) pair, per user; maintained by analytics.py"""
+    __tablename__ = 'confusion_matrix'
+    __table_args__ = (db.UniqueConstraint('user_id', 'predicted', 'actual', name='uq_confusion_cell'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    predicted = db.Column(db.String(100), nullable=False)
+    actual = db.Column(db.String(100), nullable=False)  # '' when the user said "wrong" without a correction
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+
+# ─── Sync bookkeeping ────────────────────────────────────────────────────────
+
+@event.listens_for(Scan, 'after_delete')
+def _scan_tombstone(mapper, connection, target):
+    connection.execute(Tombstone.__table__.insert().values(
+        user_id=target.user_id, entity='scan', entity_id=target.id, deleted_at=datetime.utcnow()))
+
+
+@event.listens_for(Feedback, 'after_delete')
+def _feedback_tombstone(mapper, connection, target):
+    connection.execute(Tombstone.__table__.insert().values(
+        user_id=target.user_id, entity='feedback', entity_id=target.id, deleted_at=datetime.utcnow()))
+
+
+@event.listens_for(Feedback, 'after_insert')
+def _touch_scan_on_feedback(mapper, connection, target):
+    # has_feedback is part of the scan payload, so the scan counts as changed
+    connection.execute(Scan.__table__.update()
+                       .where(Scan.__table__.c.id == target.scan_id)
+                       .values(updated_at=datetime.utcnow()))
@@ -0,0 +1,92 @@
+"""
+passwords.py — Password hashing on a dedicated, bounded worker pool.
+
+Password hashes are deliberately slow and CPU-bound. Running them on a
+small fixed pool (hashlib releases the GIL) keeps a burst of logins or
+registrations from starving the scan endpoints. When too many jobs are
+pending the call fails fast with HashingBusy instead of queueing.
+
+Configuration (environment):
+    AGBOT_PASSWORD_METHOD       Werkzeug method, e.g. 'scrypt' or 'pbkdf2:sha256:600000'
+    AGBOT_PASSWORD_SALT_LENGTH  salt length in characters (default 16)
+    AGBOT_HASH_WORKERS          threads in the hashing pool (default 2)
+    AGBOT_HASH_MAX_PENDING      running + queued jobs before rejecting (default 32)
+    AGBOT_HASH_TIMEOUT          seconds a request waits for its hash (default 10)
+
+Stored hashes made with different parameters still verify, and
+needs_rehash() tells the caller to upgrade them on the next login.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import (DEFAULT_PBKDF2_ITERATIONS, check_password_hash,
+                               generate_password_hash)
+
+PASSWORD_METHOD = os.environ.get('AGBOT_PASSWORD_METHOD', 'scrypt')
+PASSWORD_SALT_LENGTH = int(os.environ.get('AGBOT_PASSWORD_SALT_LENGTH', 16))
+HASH_WORKERS = int(os.environ.get('AGBOT_HASH_WORKERS', 2))
+HASH_MAX_PENDING = int(os.environ.get('AGBOT_HASH_MAX_PENDING', 32))
+HASH_TIMEOUT = float(os.environ.get('AGBOT_HASH_TIMEOUT', 10))
+
+# Seconds clients are told to wait (Retry-After) when the pool is saturated
+RETRY_AFTER = 2
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated or a hash takes too long."""
+
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='pwhash')
+_slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy('Too many password operations in progress')
+    try:
+        future = _executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashingBusy('Password operation timed out')
+
+
+def hash_password(password):
+    """Hash a password with the configured method on the hashing pool."""
+    return _run(generate_password_hash, password, PASSWORD_METHOD, PASSWORD_SALT_LENGTH)
+
+
+def verify_password(pwhash, password):
+    """Check a password against a stored hash on the hashing pool."""
+    if not pwhash or password is None:
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+def _expand_method(method):
+    # Werkzeug stores the method with its defaults filled in ('scrypt' ->
+    # 'scrypt:32768:8:1'), so expand the configured string the same way.
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return f'scrypt:{2 ** 15}:8:1'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+_method_prefix = _expand_method(PASSWORD_METHOD)
+
+
+def needs_rehash(pwhash):
+    """Return True if pwhash was made with a different method, cost or salt length."""
+    method, _, rest = pwhash.partition('$')
+    salt = rest.partition('$')[0]
+    return method != _method_prefix or len(salt) != PASSWORD_SALT_LENGTH
@@ -0,0 +1,150 @@
+"""
+query_budgets.py — Check the per-endpoint SQL budgets in sql_profiler.QUERY_BUDGETS.
+
+Builds the app on a scratch SQLite database and upload folder, seeds a
+user with a few scans and feedback rows, then sends each budgeted
+endpoint a request through app.test_client() and counts its SQL
+statements. Endpoints over their budget are listed with their most
+frequent statements and make the exit status 1, so it can gate CI. A
+budget with no request defined here, or a request that fails, also
+fails the run.
+
+The server itself never enforces the budgets; an over-budget request in
+production is only logged (see sql_profiler.py).
+
+    python query_budgets.py
+    python query_budgets.py --repeat 3 --scans 20
+"""
+
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINED_MODEL = os.path.join(BASE_DIR, 'ml_model', 'agbot_model.pth')
+PASSWORD = 'query-budget-password'
+
+
+def _image(seed):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (320, 240), (seed * 37 % 256, 120, 60)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def _configure(workdir, random_weights):
+    """Point the app at scratch copies of everything it writes; call before importing app."""
+    os.environ.update(
+        AGBOT_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'budgets.db')}",
+        AGBOT_UPLOAD_DIR=os.path.join(workdir, 'uploads'),
+        AGBOT_COLD_STORAGE_DIR=os.path.join(workdir, 'archive'),
+        AGBOT_SQL_PROFILE_SAMPLE='0',  # counted below instead
+        AGBOT_RATE_LIMIT='0',
+        AGBOT_LOG_LEVEL=os.environ.get('AGBOT_LOG_LEVEL', 'WARNING'),
+        WEATHER_API_KEY='demo')
+    if random_weights:
+        # Set before benchmark imports model.py, which reads it at import
+        os.environ['AGBOT_MODEL_PATH'] = os.path.join(workdir, 'random.pth')
+        sys.path.insert(0, os.path.join(BASE_DIR, 'ml_model'))
+        from benchmark import write_random_checkpoint
+        write_random_checkpoint(os.environ['AGBOT_MODEL_PATH'])
+
+
+def _seed(app, scans):
+    """Register a user with `scans` scans and feedback on each; return the API and web clients."""
+    api, web = app.test_client(), app.test_client()
+    email = 'budgets@example.com'
+    r = api.post('/api/auth/register', json={'name': 'Budgets', 'email': email, 'password': PASSWORD})
+    if r.status_code != 201:
+        raise SystemExit(f"Seeding failed: register returned {r.status_code}")
+    headers = {'Authorization': f"Bearer {r.get_json()['token']}"}
+    for i in range(scans):
+        r = api.post('/api/analyze', headers=headers, content_type='multipart/form-data',
+                     data={'image': (io.BytesIO(_image(i)), f'leaf{i}.jpg')})
+        if r.status_code != 200:
+            raise SystemExit(f"Seeding failed: analyze returned {r.status_code}")
+        api.post('/api/feedback', headers=headers, json={'scan_id': r.get_json()['scan_id'],
+                                                         'is_correct': i % 2 == 0,
+                                                         'actual_pest_name': 'Aphids'})
+    web.post('/login', data={'email': email, 'password': PASSWORD})
+    return api, web, headers, email
+
+
+def _requests(api, web, headers, email):
+    """Route template -> function sending one request to it, for every budgeted endpoint."""
+    image = _image(99)
+    return {
+        '/api/auth/login': lambda: api.post('/api/auth/login', json={'email': email, 'password': PASSWORD}),
+        '/api/auth/me': lambda: api.get('/api/auth/me', headers=headers),
+        '/api/dashboard': lambda: api.get('/api/dashboard', headers=headers),
+        '/api/analyze': lambda: api.post('/api/analyze', headers=headers, content_type='multipart/form-data',
+                                         data={'image': (io.BytesIO(image), 'leaf.jpg')}),
+        '/api/chat': lambda: api.post('/api/chat', headers=headers, json={'message': 'How do I treat aphids?'}),
+        '/api/analytics/accuracy': lambda: api.get('/api/analytics/accuracy', headers=headers),
+        '/': lambda: web.get('/'),
+        '/analyze': lambda: web.post('/analyze', json={'image_data': base64.b64encode(image).decode()}),
+    }
+
+
+def measure(requests, repeat=2):
+    """Run each request `repeat` times; return {endpoint: (status, worst Profile)}."""
+    import sql_profiler
+
+    results = {}
+    for endpoint, send in requests.items():
+        worst = None
+        for _ in range(repeat):
+            with sql_profiler.profiling() as profile:
+                response = send()
+            status = response.status_code
+            if worst is None or profile.count > worst.count:
+                worst = profile
+            if status >= 400:
+                break
+        results[endpoint] = (status, worst)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=2, help='requests per endpoint; the highest count is kept')
+    parser.add_argument('--scans', type=int, default=5, help='scans (each with feedback) seeded first')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='use a random-weight model even if agbot_model.pth exists')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        _configure(workdir, args.random_weights or not os.path.exists(TRAINED_MODEL))
+        from app import app, init_database
+        from sql_profiler import QUERY_BUDGETS
+
+        init_database()
+        requests = _requests(*_seed(app, args.scans))
+        results = measure({k: v for k, v in requests.items() if k in QUERY_BUDGETS}, args.repeat)
+
+    failures = [f"{endpoint}: no request defined in query_budgets.py"
+                for endpoint in QUERY_BUDGETS if endpoint not in requests]
+    print(f"{'endpoint':<28}{'status':>7}{'queries':>9}{'budget':>8}")
+    for endpoint, (status, profile) in results.items():
+        budget = QUERY_BUDGETS[endpoint]
+        print(f"{endpoint:<28}{status:>7}{profile.count:>9}{budget:>8}")
+        if status >= 400:
+            failures.append(f"{endpoint}: returned {status}")
+        elif profile.count > budget:
+            worst = '\n'.join(f"      {n}x {s[:120]}" for s, n in profile.shapes.most_common(3))
+            failures.append(f"{endpoint}: {profile.count} statements (budget {budget})\n{worst}")
+    print()
+
+    if failures:
+        print(f"{len(failures)} query-budget problem(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All {len(results)} endpoints within their query budgets")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+rate_limit.py — Per-user/per-IP rate limits and admission control for inference.
+
+Each limited endpoint belongs to a scope (analyze, symptoms, chat). A
+request spends one token from two token buckets: the user's bucket for
+that scope, and the client IP's bucket, which is IP_FACTOR times larger
+so several farmers behind one NAT don't throttle each other. The client
+IP is request.remote_addr, which app.py rewrites from X-Forwarded-For
+behind AGBOT_TRUSTED_PROXIES proxies (otherwise every client would share
+the proxy's bucket). If either
+bucket is empty, the request is rejected with 429 and a Retry-After
+header that says when a token will be available.
+
+Running the model also needs an inference slot (`inference_slot()`,
+taken around model.predict). At most MAX_INFERENCES run at once per
+process. A request waits up to ADMISSION_WAIT seconds for a free slot and
+otherwise gets 503 with Retry-After, instead of queueing behind an
+unbounded backlog. The slot is taken only after the image has been read
+and decoded, so slow uploads don't hold one.
+
+Buckets live in process memory by default. Several workers on one host
+can share them through a small SQLite file (AGBOT_RATE_LIMIT_DB). If that
+store fails, requests are allowed through (fail open).
+
+Configuration (environment):
+    AGBOT_RATE_LIMIT              '0' disables rate limiting (default on)
+    AGBOT_RATE_<SCOPE>_PER_MIN    sustained requests per minute per user
+    AGBOT_RATE_<SCOPE>_BURST      bucket size per user
+    AGBOT_RATE_IP_FACTOR          per-IP bucket = per-user bucket x factor (default 4)
+    AGBOT_RATE_LIMIT_DB           path of a shared SQLite bucket store (default: in-process)
+    AGBOT_MAX_INFERENCES          concurrent inferences per process (default 4)
+    AGBOT_ADMISSION_WAIT          seconds to wait for an inference slot (default 0.5)
+"""
+
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request
+from flask_login import current_user
+
+import metrics
+
+ENABLED = os.environ.get('AGBOT_RATE_LIMIT', '1') != '0'
+IP_FACTOR = float(os.environ.get('AGBOT_RATE_IP_FACTOR', 4))
+RATE_LIMIT_DB = os.environ.get('AGBOT_RATE_LIMIT_DB', '')
+MAX_INFERENCES = int(os.environ.get('AGBOT_MAX_INFERENCES', 4))
+ADMISSION_WAIT = float(os.environ.get('AGBOT_ADMISSION_WAIT', 0.5))
+OVERLOAD_RETRY_AFTER = 2
+
+
+def _limit(scope, per_min, burst):
+    return (float(os.environ.get(f'AGBOT_RATE_{scope.upper()}_PER_MIN', per_min)),
+            float(os.environ.get(f'AGBOT_RATE_{scope.upper()}_BURST', burst)))
+
+
+# scope -> (sustained requests per minute, burst) per user
+LIMITS = {
+    'analyze': _limit('analyze', 20, 5),
+    'symptoms': _limit('symptoms', 30, 10),
+    'chat': _limit('chat', 60, 15),
+}
+
+REJECTED = metrics.register(metrics.Counter(
+    'agbot_requests_rejected_total', 'Requests refused by rate limiting or admission control',
+    ('scope', 'reason')))
+
+_log = logging.getLogger('agbot.rate_limit')
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Too many requests')
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after=OVERLOAD_RETRY_AFTER):
+        super().__init__('Server is busy')
+        self.retry_after = retry_after
+
+
+def _consume(tokens, updated, rate, burst, now):
+    """Token-bucket step: (allowed, tokens left, seconds until a token is available)."""
+    if tokens is None:
+        tokens = burst
+    else:
+        tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, (1 - tokens) / rate
+
+
+# ─── Bucket stores ──────────────────────────────────────────────────────────────
+
+class MemoryStore:
+    def __init__(self, maxsize=50000):
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (None, now))
+            allowed, tokens, retry_after = _consume(tokens, updated, rate, burst, now)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._maxsize:
+                self._buckets.popitem(last=False)  # least recently used
+            return allowed, retry_after
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute('CREATE TABLE IF NOT EXISTS rate_buckets ('
+                                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            allowed, tokens, retry_after = _consume(row[0] if row else None, row[1] if row else now,
+                                                    rate, burst, now)
+            conn.execute('INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                         'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                         (key, tokens, now))
+            if random.random() < 0.001:
+                # Buckets idle for an hour are full again; drop them
+                conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - 3600,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+_store = SQLiteStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryStore()
+
+
+def check(scope, user_id):
+    """Spend a token from the user's and the IP's bucket, or raise RateLimited."""
+    per_min, burst = LIMITS[scope]
+    rate = per_min / 60
+    now = time.time()
+    retry_after = 0
+    try:
+        for key, factor in ((f'{scope}:user:{user_id}', 1), (f'{scope}:ip:{request.remote_addr}', IP_FACTOR)):
+            allowed, wait = _store.take(key, rate * factor, burst * factor, now)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+    except sqlite3.Error as e:
+        _log.warning('Rate limit store failed; allowing request', extra={'error': str(e)})
+        return
+    if retry_after:
+        REJECTED.inc(scope, 'rate_limited')
+        raise RateLimited(max(1, math.ceil(retry_after)))
+
+
+# ─── Admission control ──────────────────────────────────────────────────────────
+
+_slots = threading.BoundedSemaphore(MAX_INFERENCES)
+
+
+@contextmanager
+def inference_slot(scope='analyze'):
+    """Hold one of the MAX_INFERENCES slots around a model call, or raise Overloaded."""
+    if not _slots.acquire(timeout=ADMISSION_WAIT):
+        REJECTED.inc(scope, 'overloaded')
+        raise Overloaded()
+    try:
+        yield
+    finally:
+        _slots.release()
+
+
+# ─── Decorator ──────────────────────────────────────────────────────────────────
+
+def _user_id():
+    user = g.get('api_user')
+    if user is None and current_user.is_authenticated:
+        user = current_user
+    return user.id if user is not None else None
+
+
+def limit(scope):
+    """Rate-limit an authenticated view. Apply below token_required / login_required."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if ENABLED:
+                check(scope, _user_id())
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def error_response(e):
+    """JSON 429/503 with Retry-After, for RateLimited and Overloaded."""
+    if isinstance(e, RateLimited):
+        body, status = {'error': 'Too many requests, please slow down', 'retry_after': e.retry_after}, 429
+    else:
+        body, status = {'error': 'Server is busy, please try again shortly', 'retry_after': e.retry_after}, 503
+    return body, status, {'Retry-After': str(e.retry_after)}
@@ -0,0 +1,55 @@
+"""
+result_store.py — Server-side store for the web results page.
+
+Full analysis results (treatments, all predictions, ...) used to ride in
+the signed session cookie. They now live here, keyed by (user id, scan id),
+and the session only carries the scan id. Entries expire after a TTL and
+the least recently used are evicted first. If an entry is gone (expired,
+evicted, or written by another worker) the result is rebuilt from the
+Scan row, so /results?scan_id=N keeps working.
+"""
+
+import os
+
+from cache import TTLCache
+from models import Scan
+
+RESULT_TTL = int(os.environ.get('AGBOT_RESULT_TTL', 3600))
+RESULT_MAX_ENTRIES = int(os.environ.get('AGBOT_RESULT_MAX_ENTRIES', 1000))
+
+_results = TTLCache(maxsize=RESULT_MAX_ENTRIES, ttl=RESULT_TTL)
+
+
+def put(user_id, scan_id, result):
+    """Remember the full result for one of the user's scans."""
+    _results.set((user_id, scan_id), dict(result))
+
+
+def get(user_id, scan_id):
+    """Return the stored result for the user's scan, or None if it doesn't exist."""
+    result = _results.get((user_id, scan_id))
+    if result is not None:
+        return dict(result)
+
+    scan = Scan.query.filter_by(id=scan_id, user_id=user_id).first()
+    if scan is None:
+        return None
+    return _from_scan(scan)
+
+
+def _from_scan(scan):
+    """Rebuild a results-page dict from what the Scan row recorded."""
+    result = {
+        'type': 'text' if scan.status == 'Analyzed' else 'image',
+        'scan_id': scan.id,
+        'status': scan.status or 'Analyzed',
+        'pest_identified': scan.pest_identified or 'None',
+        'pest_scientific': scan.pest_scientific or '',
+        'confidence': scan.confidence or 0,
+        'damage_pattern': scan.damage_pattern or '',
+        'severity': scan.severity or 'Unknown',
+        'image_path': scan.image_path,
+    }
+    if scan.severity == 'Healthy':
+        result['message'] = 'Your plant appears to be healthy! No pests detected.'
+    return result
@@ -0,0 +1,184 @@
+"""
+retention.py — Hot/cold archival of old scans.
+
+Scans older than RETENTION_DAYS move from `scans` to `scans_archive`,
+keeping the same id, in batches of ARCHIVE_BATCH_SIZE. Each batch is
+one short transaction. Their feedback is folded into the archived row
+as JSON, and the per-user monthly totals are added to
+`scan_monthly_stats`, so dashboards keep their long-term numbers. Once
+no hot scan refers to an image, it moves to cold storage
+(storage.COLD_FOLDER), where it can still be served.
+
+This keeps the hot table, and every per-user count or history query on
+it, bounded by the retention window instead of by account age. History
+and export reach archived scans on request (?include_archived=1).
+
+Archiving is not a deletion, so no sync tombstones are written (the
+Core-level deletes below skip the ORM delete hooks).
+
+Run periodically (e.g. daily cron): `flask --app app archive-scans`.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert
+
+import storage
+from models import db, Scan, Feedback, ArchivedScan, ScanMonthlyStat
+
+_log = logging.getLogger('agbot.retention')
+
+RETENTION_DAYS = int(os.environ.get('AGBOT_RETENTION_DAYS', 365))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('AGBOT_ARCHIVE_BATCH_SIZE', 500))
+ARCHIVE_PAUSE = float(os.environ.get('AGBOT_ARCHIVE_PAUSE', 0.05))  # seconds between batches
+
+_SCAN_COLUMNS = ['id', 'user_id', 'image_path', 'pest_identified', 'pest_scientific', 'confidence',
+                 'status', 'severity', 'crop_type', 'field_name', 'damage_pattern', 'created_at',
+                 'updated_at']
+
+
+def cutoff_for(days=None):
+    return datetime.utcnow() - timedelta(days=RETENTION_DAYS if days is None else days)
+
+
+def archive_scans(days=None, batch_size=None, dry_run=False, pause=None, log=print):
+    """Archive scans older than `days`. Returns the number of scans archived (or eligible).
+
+    Must run inside an app context.
+    """
+    cutoff = cutoff_for(days)
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    pause = ARCHIVE_PAUSE if pause is None else pause
+
+    if dry_run:
+        return Scan.query.filter(Scan.created_at < cutoff).count()
+
+    archived = 0
+    while True:
+        moved, images = _archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        archived += moved
+        cold = sum(1 for key in images if _move_image_if_unreferenced(key))
+        log(f"archived {moved} scan(s), {cold} image(s) to cold storage")
+        if pause:
+            time.sleep(pause)
+    return archived
+
+
+def _archive_batch(cutoff, batch_size):
+    scans = db.session.execute(
+        db.select(*[getattr(Scan, c) for c in _SCAN_COLUMNS])
+        .where(Scan.created_at < cutoff)
+        .order_by(Scan.id)
+        .limit(batch_size)
+    ).all()
+    if not scans:
+        return 0, set()
+
+    ids = [row.id for row in scans]
+    feedbacks = Feedback.query.filter(Feedback.scan_id.in_(ids)).all()
+    feedback_by_scan = {}
+    for fb in feedbacks:
+        feedback_by_scan.setdefault(fb.scan_id, []).append(fb.to_dict())
+
+    now = datetime.utcnow()
+    archive_rows = []
+    for row in scans:
+        record = dict(row._mapping)
+        feedback = feedback_by_scan.get(row.id, [])
+        record.update(archived_at=now, feedback_count=len(feedback),
+                      feedback_json=json.dumps(feedback) if feedback else None)
+        archive_rows.append(record)
+
+    try:
+        db.session.execute(insert(ArchivedScan.__table__), archive_rows)
+        _add_monthly_stats(scans)
+        db.session.execute(delete(Feedback.__table__).where(Feedback.__table__.c.scan_id.in_(ids)))
+        db.session.execute(delete(Scan.__table__).where(Scan.__table__.c.id.in_(ids)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # The rows are gone; don't let the session try to refresh them later
+    for fb in feedbacks:
+        db.session.expunge(fb)
+    return len(scans), {row.image_path for row in scans if row.image_path}
+
+
+def _add_monthly_stats(scans):
+    buckets = {}
+    for row in scans:
+        month = row.created_at.strftime('%Y-%m') if row.created_at else 'unknown'
+        bucket = buckets.setdefault((row.user_id, month), {
+            'total': 0, 'confidence_sum': 0.0, 'severity': Counter(), 'pests': Counter()})
+        bucket['total'] += 1
+        bucket['confidence_sum'] += row.confidence or 0
+        bucket['severity'][row.severity or ''] += 1  # '' = no severity recorded
+        bucket['pests'][row.pest_identified or 'Unknown'] += 1
+
+    for (user_id, month), bucket in buckets.items():
+        stat = ScanMonthlyStat.query.filter_by(user_id=user_id, month=month).first()
+        if stat is None:
+            stat = ScanMonthlyStat(user_id=user_id, month=month, total=0, confidence_sum=0)
+            db.session.add(stat)
+        severity = Counter(json.loads(stat.severity_counts or '{}')) + bucket['severity']
+        pests = Counter(json.loads(stat.pest_counts or '{}')) + bucket['pests']
+        stat.total += bucket['total']
+        stat.confidence_sum += bucket['confidence_sum']
+        stat.severity_counts = json.dumps(dict(severity))
+        stat.pest_counts = json.dumps(dict(pests))
+    db.session.flush()
+
+
+def _move_image_if_unreferenced(key):
+    # Content-addressed blobs can be shared with newer scans that are still hot
+    if db.session.query(Scan.id).filter(Scan.image_path == key).first() is not None:
+        return False
+    try:
+        return storage.move_to_cold(key)
+    except OSError as e:
+        _log.warning('Cold storage move failed', extra={'key': key, 'error': str(e)})
+        return False
+
+
+# ─── Read side ──────────────────────────────────────────────────────────────────
+
+def archived_totals(user_id):
+    """Totals over a user's archived scans: {'total', 'healthy', 'pests', 'severity': {...}}."""
+    severity = Counter()
+    total = 0
+    for stat in ScanMonthlyStat.query.filter_by(user_id=user_id).all():
+        total += stat.total
+        severity.update(json.loads(stat.severity_counts or '{}'))
+    healthy = severity.get('Healthy', 0)
+    return {
+        'total': total,
+        'healthy': healthy,
+        'pests': total - healthy - severity.get('', 0),
+        'severity': dict(severity),
+    }
+
+
+def archived_monthly_counts(user_id):
+    """{'YYYY-MM': archived scan count} for a user."""
+    rows = db.session.query(ScanMonthlyStat.month, ScanMonthlyStat.total).filter_by(user_id=user_id)
+    return {month: total for month, total in rows}
+
+
+def archived_scans(user_id, limit=None, offset=0):
+    """A user's archived scans, newest first."""
+    query = ArchivedScan.query.filter_by(user_id=user_id).order_by(
+        ArchivedScan.created_at.desc(), ArchivedScan.id.desc()).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def archived_count(user_id):
+    return db.session.query(func.count(ArchivedScan.id)).filter_by(user_id=user_id).scalar()
@@ -0,0 +1,178 @@
+"""
+sql_profiler.py — Per-request SQL profiling and N+1 detection.
+
+For a sampled share of requests (AGBOT_SQL_PROFILE_SAMPLE; 0 by default,
+1 when the app runs in debug mode), engine events time every statement
+and group them by shape: the SQL text with whitespace and parameter
+lists collapsed. When the request finishes:
+
+- X-DB-Queries, X-DB-Time-Ms and X-DB-Repeated response headers give the
+  statement count, total time in the database, and the number of shapes
+  run at least AGBOT_SQL_REPEAT_THRESHOLD times;
+- agbot_db_time_seconds{endpoint} and agbot_db_repeated_statements_total
+  {endpoint} are added to /metrics;
+- each repeated shape is logged to agbot.sql as a likely N+1 query.
+
+QUERY_BUDGETS caps the statements per request for endpoints with a fixed
+query cost. Endpoints whose query count grows with the data are caught by
+the repeated-shape check instead. query_budgets.py runs every budgeted
+endpoint and fails on an overrun; a profiled request over its budget in
+the server is only logged. assert_max_queries() applies the same check
+to any block of code.
+"""
+
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import metrics
+
+PROFILE_SAMPLE = os.environ.get('AGBOT_SQL_PROFILE_SAMPLE')
+REPEAT_THRESHOLD = int(os.environ.get('AGBOT_SQL_REPEAT_THRESHOLD', 5))
+
+# Statements per request (route template -> max), measured with a few scans
+# and feedback rows and given a little headroom; checked by query_budgets.py
+QUERY_BUDGETS = {
+    '/api/auth/login': 4,
+    '/api/auth/me': 2,
+    '/api/dashboard': 20,
+    '/api/analyze': 4,
+    '/api/chat': 1,
+    '/api/analytics/accuracy': 3,
+    '/': 20,
+    '/analyze': 5,
+}
+
+DB_TIME = metrics.register(metrics.Histogram(
+    'agbot_db_time_seconds', 'Time spent executing SQL per profiled request', ('endpoint',)))
+REPEATED = metrics.register(metrics.Counter(
+    'agbot_db_repeated_statements_total', 'Statement shapes repeated past the N+1 threshold', ('endpoint',)))
+
+_log = logging.getLogger('agbot.sql')
+_active = ContextVar('sql_profiles', default=())
+
+_WHITESPACE = re.compile(r'\s+')
+_PARAM_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def shape(statement):
+    """Statement text with whitespace and IN (...) parameter lists collapsed."""
+    return _PARAM_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class Profile:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[shape(statement)] += 1
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        return [(s, n) for s, n in self.shapes.most_common() if n >= threshold]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('sql_profiler_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    profiles = _active.get()
+    if profiles and conn.info.get('sql_profiler_started'):
+        elapsed = time.perf_counter() - conn.info['sql_profiler_started'].pop()
+        for profile in profiles:
+            profile.record(statement, elapsed)
+
+
+@contextmanager
+def profiling():
+    """Record the statements run inside the block into a new Profile."""
+    profile = Profile()
+    token = _active.set(_active.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    """Raise QueryBudgetExceeded if the block runs more than `limit` statements."""
+    with profiling() as profile:
+        yield profile
+    if profile.count > limit:
+        raise QueryBudgetExceeded(_budget_message(label, profile, limit))
+
+
+def _budget_message(label, profile, limit):
+    worst = '; '.join(f'{n}x {s[:120]}' for s, n in profile.shapes.most_common(3))
+    return f'{label} ran {profile.count} SQL statements (budget {limit}). Most frequent: {worst}'
+
+
+# ─── Flask wiring ───────────────────────────────────────────────────────────────
+
+def _before_request():
+    if random.random() < current_app.config['SQL_PROFILE_SAMPLE']:
+        profile = Profile()
+        g.sql_profile = profile
+        g.sql_profile_token = _active.set(_active.get() + (profile,))
+
+
+def _after_request(response):
+    profile = g.pop('sql_profile', None)
+    if profile is None:
+        return response
+    _active.reset(g.pop('sql_profile_token'))
+
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    repeated = profile.repeated()
+    response.headers['X-DB-Queries'] = str(profile.count)
+    response.headers['X-DB-Time-Ms'] = f'{profile.seconds * 1000:.1f}'
+    response.headers['X-DB-Repeated'] = str(len(repeated))
+    DB_TIME.observe(profile.seconds, endpoint)
+    for statement, count in repeated:
+        REPEATED.inc(endpoint)
+        _log.warning('Repeated SQL statement (likely N+1)',
+                     extra={'endpoint': endpoint, 'count': count, 'statement': statement[:500]})
+
+    budget = QUERY_BUDGETS.get(endpoint)
+    if budget is not None and profile.count > budget:
+        message = _budget_message(f'{request.method} {endpoint}', profile, budget)
+        _log.warning(message, extra={'endpoint': endpoint, 'queries': profile.count, 'budget': budget})
+    return response
+
+
+def _teardown_request(exc):
+    # Unwind if the request failed before after_request ran
+    token = g.pop('sql_profile_token', None)
+    if token is not None:
+        g.pop('sql_profile', None)
+        _active.reset(token)
+
+
+def init_app(app):
+    """Profile a sample of requests (everything in debug mode)."""
+    rate = float(PROFILE_SAMPLE) if PROFILE_SAMPLE is not None else (1.0 if app.debug else 0.0)
+    app.config.setdefault('SQL_PROFILE_SAMPLE', rate)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,276 @@
+"""
+storage.py — Content-addressed storage for uploaded scan images.
+
+Each image is stored once, named by the SHA-256 of its bytes and sharded
+into two directory levels:
+
+    static/uploads/3f/a2/3fa2...e9.jpg      (Scan.image_path = '3f/a2/3fa2...e9.jpg')
+
+Identical photos dedupe to a single blob, same-second uploads can't
+collide, and no single directory grows without bound. Blobs are
+reference-counted through Scan.image_path and ArchivedScan.image_path;
+collect_garbage() removes blobs no scan, hot or archived, points at any
+more. Older flat filenames
+('20250101_120000_scan.jpg') still resolve and are left alone.
+
+Smaller renditions for list views are written next to each blob in the
+background ('<hash>_thumb.webp', '<hash>_medium.webp'). They are made
+on demand for images stored before the pipeline existed, but only from
+original '<hash>.<ext>' keys (is_original), never from a rendition or a
+legacy name, so the set of files a request can create stays bounded.
+
+Images of archived scans (retention.py) move to COLD_FOLDER under the
+same key. locate() checks the hot folder first, then the cold one, so
+archived images still serve and render. collect_garbage() sweeps both
+folders.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+import metrics
+
+_log = logging.getLogger('agbot.storage')
+
+UPLOAD_FOLDER = os.environ.get('AGBOT_UPLOAD_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
+COLD_FOLDER = os.environ.get('AGBOT_COLD_STORAGE_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive', 'uploads')
+
+# Blobs younger than this are never collected, so an upload whose Scan row
+# hasn't been committed yet can't be swept away underneath it.
+GC_GRACE_SECONDS = 3600
+
+_MAGIC = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+]
+
+# Derivative renditions: name -> longest edge in pixels
+DERIVATIVE_SIZES = {'thumb': 160, 'medium': 640}
+DERIVATIVE_FORMAT = 'webp' if features.check('webp') else 'jpg'
+
+_ORIGINAL_KEY = re.compile(r'([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.(?:%s)' %
+                           '|'.join(sorted({ext for _, ext in _MAGIC} | {'webp'})))
+
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+_derivative_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='derivatives')
+
+
+def sniff_extension(data):
+    """Return the file extension for image bytes based on their magic number, or None."""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for magic, ext in _MAGIC:
+        if data.startswith(magic):
+            return ext
+    return None
+
+
+def key_for(data, ext):
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def save(image_bytes):
+    """Store image bytes and return their storage key (the value for Scan.image_path).
+
+    Formats we can't recognise are re-encoded as JPEG first.
+    """
+    with metrics.stage('image_store'):
+        return _save(image_bytes)
+
+
+def _save(image_bytes):
+    ext = sniff_extension(image_bytes)
+    if ext is None:
+        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=85)
+        image_bytes, ext = buf.getvalue(), 'jpg'
+
+    key = key_for(image_bytes, ext)
+    path = os.path.join(UPLOAD_FOLDER, key)
+    if os.path.exists(path):
+        # Already stored: refresh mtime so the GC grace period covers this reuse
+        os.utime(path)
+        return key
+
+    _write_atomic(path, image_bytes)
+    _derivative_executor.submit(_make_all_derivatives, key)
+    return key
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def path_for(key):
+    """Absolute filesystem path for a storage key."""
+    return os.path.join(UPLOAD_FOLDER, key)
+
+
+def locate(key):
+    """Path of a key in hot storage, else in cold storage if it was archived there."""
+    path = path_for(key)
+    if not os.path.exists(path):
+        cold = os.path.join(COLD_FOLDER, key)
+        if os.path.exists(cold):
+            return cold
+    return path
+
+
+def folder_for(key):
+    """Root folder (UPLOAD_FOLDER or COLD_FOLDER) that holds a key."""
+    return UPLOAD_FOLDER if locate(key) == path_for(key) else COLD_FOLDER
+
+
+def move_to_cold(key):
+    """Move a blob to cold storage and drop its (re-renderable) derivatives.
+
+    Returns True if the blob was moved.
+    """
+    src = path_for(key)
+    if not os.path.isfile(src):
+        return False
+    dst = os.path.join(COLD_FOLDER, key)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.move(src, dst)
+    if digest_of(key) is not None:
+        for size in DERIVATIVE_SIZES:
+            try:
+                os.remove(path_for(derivative_key(key, size)))
+            except FileNotFoundError:
+                pass
+    return True
+
+
+def is_safe_key(key):
+    """True if key stays inside UPLOAD_FOLDER (no absolute paths or '..')."""
+    root = os.path.realpath(UPLOAD_FOLDER)
+    return os.path.realpath(path_for(key)).startswith(root + os.sep)
+
+
+def is_original(key):
+    """True if key names an original sharded blob ('aa/bb/<sha256>.<ext>'), not a rendition."""
+    return _ORIGINAL_KEY.fullmatch(key) is not None
+
+
+def derivative_key(key, size):
+    """Storage key of the given rendition ('thumb' or 'medium') of a blob."""
+    return f"{key.rsplit('.', 1)[0]}_{size}.{DERIVATIVE_FORMAT}"
+
+
+def make_derivative(key, size):
+    """Render one derivative of a stored image (if missing) and return its key."""
+    dkey = derivative_key(key, size)
+    dpath = path_for(dkey)
+    if os.path.exists(dpath):
+        return dkey
+
+    edge = DERIVATIVE_SIZES[size]
+    with Image.open(locate(key)) as img:
+        img.draft('RGB', (edge, edge))  # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        img.thumbnail((edge, edge))
+        buf = io.BytesIO()
+        if DERIVATIVE_FORMAT == 'webp':
+            img.save(buf, 'WEBP', quality=80, method=4)
+        else:
+            img.save(buf, 'JPEG', quality=80, optimize=True)
+    _write_atomic(dpath, buf.getvalue())
+    return dkey
+
+
+def _make_all_derivatives(key):
+    for size in DERIVATIVE_SIZES:
+        try:
+            with metrics.stage('derivative_render'):
+                make_derivative(key, size)
+        except Exception as e:
+            _log.warning('Derivative failed', extra={'key': key, 'size': size, 'error': str(e)})
+
+
+def digest_of(key):
+    """SHA-256 a sharded blob or derivative key belongs to, or None for other files."""
+    parts = key.split('/')
+    if len(parts) != 3:
+        return None
+    digest = parts[2].split('.', 1)[0].split('_', 1)[0]
+    if len(digest) == 64 and parts[0] == digest[:2] and parts[1] == digest[2:4]:
+        return digest
+    return None
+
+
+def _iter_blobs(root):
+    if not os.path.isdir(root):
+        return
+    for shard1 in os.listdir(root):
+        dir1 = os.path.join(root, shard1)
+        if len(shard1) != 2 or not os.path.isdir(dir1):
+            continue
+        for shard2 in os.listdir(dir1):
+            dir2 = os.path.join(dir1, shard2)
+            if not os.path.isdir(dir2):
+                continue
+            for name in os.listdir(dir2):
+                yield f"{shard1}/{shard2}/{name}"
+
+
+def collect_garbage(dry_run=False, grace_seconds=GC_GRACE_SECONDS):
+    """Delete blobs (and their derivatives) that no Scan or ArchivedScan references.
+
+    Sweeps the hot and the cold folder. A blob is kept in either place while
+    any scan, hot or archived, points at it, and so are exactly its
+    derivative_key() renditions; any other file named after a digest goes.
+    Returns the removed keys, with cold ones prefixed 'cold:'. Must run
+    inside an app context.
+    """
+    from models import db, Scan, ArchivedScan
+
+    referenced = set()
+    for model in (Scan, ArchivedScan):
+        referenced.update(row[0] for row in db.session.query(model.image_path).distinct()
+                          if row[0] and is_original(row[0]))
+    referenced.update([derivative_key(key, size) for key in referenced for size in DERIVATIVE_SIZES])
+    cutoff = time.time() - grace_seconds
+    removed = []
+    for root, label in ((UPLOAD_FOLDER, ''), (COLD_FOLDER, 'cold:')):
+        for key in _iter_blobs(root):
+            name = os.path.basename(key)
+            digest = digest_of(key)
+            if digest is None and not name.startswith('.tmp-'):
+                continue
+            if key in referenced:
+                continue
+            path = os.path.join(root, key)
+            if os.path.getmtime(path) > cutoff:
+                continue
+            removed.append(label + key)
+            if not dry_run:
+                os.remove(path)
+    return removed
@@ -0,0 +1,184 @@
+"""
+weather.py — Cached, non-blocking weather lookups for the dashboard.
+
+Lookups are cached per normalized location. A fresh entry is returned
+as-is. A stale entry is also returned immediately, and a background
+refresh is started (stale-while-revalidate). Concurrent requests for the
+same location share one in-flight fetch. A request with nothing cached
+waits at most WEATHER_WAIT seconds before falling back to the default.
+After repeated upstream failures a circuit breaker stops fetching for a
+cool-down period, and cached data (or the default) is served instead.
+Only transport errors, timeouts and 5xx responses count as failures. A 4xx
+(e.g. an unknown city) or an unreadable body is a problem with that one
+location, so it is remembered for WEATHER_ERROR_TTL and the default is
+served without asking upstream again.
+Entries expire after WEATHER_STALE_TTL, and at most WEATHER_CACHE_SIZE
+locations are kept (least recently used evicted), since locations are
+free-form profile text.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import TTLCache
+
+WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', 'demo')  # OpenWeatherMap key (free at openweathermap.org)
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'http://api.openweathermap.org/data/2.5/weather')
+
+WEATHER_TTL = 600              # seconds an entry counts as fresh
+WEATHER_STALE_TTL = 6 * 3600   # seconds a stale entry may still be served
+WEATHER_WAIT = 1.5             # max seconds a request waits on a cold fetch
+WEATHER_TIMEOUT = 5            # upstream HTTP timeout
+BREAKER_THRESHOLD = 3          # consecutive failures before the breaker opens
+BREAKER_COOLDOWN = 60          # seconds the breaker stays open
+WEATHER_CACHE_SIZE = 2048      # max locations cached
+WEATHER_ERROR_TTL = 300        # seconds a location upstream rejected is not retried
+
+DEFAULT_WEATHER = {'temperature': 24, 'condition': 'Sunny', 'humidity': 65, 'icon': 'sun.max.fill'}
+
+_ICON_MAP = {'Clear': 'sun.max.fill', 'Clouds': 'cloud.fill', 'Rain': 'cloud.rain.fill',
+             'Drizzle': 'cloud.drizzle.fill', 'Thunderstorm': 'cloud.bolt.fill',
+             'Snow': 'cloud.snow.fill', 'Mist': 'cloud.fog.fill', 'Fog': 'cloud.fog.fill'}
+
+_cache = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_STALE_TTL)  # location key -> (fetched_at, data)
+_misses = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_ERROR_TTL)  # location key -> error
+_inflight = {}    # location key -> Future
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='weather')
+_log = logging.getLogger('agbot.weather')
+
+
+class _CircuitBreaker:
+    """Opens after BREAKER_THRESHOLD consecutive failures; half-opens after the cooldown."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half-open: let one trial request through
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+_breaker = _CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+
+def _normalize(location):
+    return ' '.join(location.split()).lower()
+
+
+def _fetch(location):
+    """Blocking upstream call; runs on the weather executor."""
+    query = urllib.parse.urlencode({'q': location, 'appid': WEATHER_API_KEY, 'units': 'metric'})
+    req = urllib.request.Request(f"{WEATHER_API_URL}?{query}")
+    with urllib.request.urlopen(req, timeout=WEATHER_TIMEOUT) as resp:
+        data = json.loads(resp.read().decode())
+    condition = data['weather'][0]['main']
+    return {
+        'temperature': round(data['main']['temp']),
+        'condition': condition,
+        'humidity': data['main']['humidity'],
+        'icon': _ICON_MAP.get(condition, 'cloud.fill'),
+        'wind': round(data['wind']['speed']),
+        'location': data['name'],
+    }
+
+
+def _is_upstream_failure(exc):
+    """True for errors that say the service is unhealthy rather than the request bad."""
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code >= 500
+    return isinstance(exc, OSError)  # URLError, timeouts, connection resets
+
+
+def _refresh(key, location):
+    try:
+        data = _fetch(location)
+    except Exception as e:
+        if _is_upstream_failure(e):
+            _breaker.record_failure()
+        else:
+            # Upstream answered; the problem is this location
+            _breaker.record_success()
+            _misses.set(key, str(e))
+        _log.warning('Weather API error', extra={'location': location, 'error': str(e)})
+        raise
+    else:
+        _breaker.record_success()
+        _cache.set(key, (time.monotonic(), data))
+        return data
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def _start_refresh(key, location):
+    """Return the in-flight fetch for key, starting one if needed (None if the breaker is open)."""
+    with _lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        if not _breaker.allow():
+            return None
+        future = _executor.submit(_refresh, key, location)
+        _inflight[key] = future
+        return future
+
+
+def get_weather(location=None):
+    """Return current weather for a location, never blocking long on the upstream API."""
+    if WEATHER_API_KEY == 'demo' or not location or not location.strip():
+        return dict(DEFAULT_WEATHER)
+
+    key = _normalize(location)
+    entry = _cache.get(key)
+
+    if entry is not None:
+        fetched_at, data = entry
+        age = time.monotonic() - fetched_at
+        if age < WEATHER_TTL:
+            return dict(data)
+        # Still within WEATHER_STALE_TTL (the cache expires it after that)
+        _start_refresh(key, location)
+        return dict(data)
+
+    if _misses.get(key) is not None:
+        return dict(DEFAULT_WEATHER)
+    future = _start_refresh(key, location)
+    if future is not None:
+        try:
+            return dict(future.result(timeout=WEATHER_WAIT))
+        except Exception:
+            pass  # still in flight or upstream failed; fall back below
+    return dict(DEFAULT_WEATHER)
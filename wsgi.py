@@ -0,0 +1,60 @@
+"""
+wsgi.py — Production entry point, served by gunicorn with gunicorn.conf.py.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py turns on preload_app, so this module is imported once in
+the gunicorn master before any worker is forked. On import it:
+- creates or upgrades the schema and seeds the sample pests;
+- parses the pest knowledge base;
+- loads the model weights, but runs no inference (an OpenMP thread pool
+  started before fork() can deadlock the children);
+- calls gc.freeze(), so the cyclic GC never walks these objects and
+  dirties their pages.
+
+Workers therefore share the weights and the knowledge base copy-on-write
+instead of each holding a copy. post_fork() runs in every new worker. It
+sets the number of torch intra-op threads (AGBOT_TORCH_THREADS, default
+CPU count / workers, so N workers don't oversubscribe the cores), drops
+database connections inherited from the master, and starts the warm-up
+inference that /api/health/ready waits for.
+"""
+
+import gc
+import os
+
+import torch
+
+import app as web
+import health
+from app import app, db, get_model
+from knowledge_base import _load as _load_pest_data
+
+
+def torch_threads(workers):
+    configured = os.environ.get('AGBOT_TORCH_THREADS')
+    if configured:
+        return int(configured)
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _preload():
+    web.init_database()
+    _load_pest_data()
+    torch.set_num_threads(1)  # the master never runs inference
+    get_model()
+    with app.app_context():
+        db.engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(workers):
+    """Per-worker setup; called from gunicorn's post_fork hook."""
+    torch.set_num_threads(torch_threads(workers))
+    with app.app_context():
+        db.engine.dispose(close=False)  # the master's pooled connections belong to the master
+    health.start_warmup(get_model)
+
+
+_preload()